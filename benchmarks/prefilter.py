@@ -0,0 +1,40 @@
+"""Quality and speed of candidate pre-filtering compared with the unfiltered greedy search."""
+
+import argparse
+import time
+
+import numpy as np
+
+from stein_thinning.thinning import selection_ksd, thin
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=1_000_000, help='sample size')
+    parser.add_argument('--d', type=int, default=5, help='dimension')
+    parser.add_argument('--n-points', type=int, default=50, help='number of points to select')
+    parser.add_argument('--n-candidates', type=int, nargs='+', default=[10_000, 100_000], help='sizes of the candidate pool')
+    args = parser.parse_args()
+
+    # Standard Gaussian target
+    rng = np.random.default_rng(12345)
+    sample = rng.normal(size=(args.n, args.d))
+    gradient = -sample
+
+    start = time.perf_counter()
+    expected = thin(sample, gradient, args.n_points)
+    baseline = time.perf_counter() - start
+    baseline_ksd = selection_ksd(sample, gradient, expected)
+    print(f'n={args.n} d={args.d} n_points={args.n_points}')
+    print(f'{"prefilter":>10} {"pool":>10} {"time, s":>10} {"speedup":>8} {"KSD":>10} {"KSD ratio":>10}')
+    print(f'{"none":>10} {args.n:>10} {baseline:>10.3f} {1:>8.2f} {baseline_ksd:>10.5f} {1:>10.3f}')
+    for prefilter in ['diagonal', 'grid']:
+        for n_candidates in args.n_candidates:
+            start = time.perf_counter()
+            idx = thin(sample, gradient, args.n_points, prefilter=prefilter, n_candidates=n_candidates)
+            elapsed = time.perf_counter() - start
+            value = selection_ksd(sample, gradient, idx)
+            print(
+                f'{prefilter:>10} {n_candidates:>10} {elapsed:>10.3f} {baseline / elapsed:>8.2f}'
+                f' {value:>10.5f} {value / baseline_ksd:>10.3f}'
+            )
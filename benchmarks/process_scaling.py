@@ -0,0 +1,36 @@
+"""Scaling of Stein thinning with the number of worker processes."""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from stein_thinning.thinning import thin
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=1_000_000, help='sample size')
+    parser.add_argument('--d', type=int, default=20, help='dimension')
+    parser.add_argument('--n-points', type=int, default=50, help='number of points to select')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(), help='largest number of workers')
+    args = parser.parse_args()
+
+    # Standard Gaussian target
+    rng = np.random.default_rng(12345)
+    sample = rng.normal(size=(args.n, args.d))
+    gradient = -sample
+
+    n_workers = sorted({2 ** k for k in range(args.max_workers.bit_length())} | {args.max_workers})
+    print(f'n={args.n} d={args.d} n_points={args.n_points}')
+    print(f'{"workers":>8} {"time, s":>10} {"speedup":>8}')
+    baseline = expected = None
+    for n_jobs in n_workers:
+        start = time.perf_counter()
+        idx = thin(sample, gradient, args.n_points, n_jobs=n_jobs, backend='process')
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline, expected = elapsed, idx
+        assert np.array_equal(idx, expected), 'Selection differs from the single-worker run.'
+        print(f'{n_jobs:>8} {elapsed:>10.3f} {baseline / elapsed:>8.2f}')
@@ -0,0 +1,251 @@
+"""Benchmark suite for thinning, KSD and kernel matrix computations.
+
+Each benchmark is run for every combination of sample size, dimension, number
+of selected points and preconditioner on synthetic Gaussian and Gaussian
+mixture targets. Wall time (best of several repeats), peak memory allocated
+by Python and NumPy, and the KSD of the output are recorded. Results are
+written to a JSON file together with the package version, so that runs for
+different versions can be compared with `--compare`:
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json --compare before.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.special import logsumexp
+
+import stein_thinning
+from stein_thinning.kernel import make_precon
+from stein_thinning.stein import kmat, ksd
+from stein_thinning.thinning import _make_stein_integrand, selection_ksd, thin, thin_gf
+
+
+PRECONDITIONERS = ['id', 'med', 'sclmed', 'smpcov', 'smpvar', 'lowrank:2', 'lowrank', '1.0']
+
+# Benchmarks whose result does not depend on the number of selected points
+WITHOUT_POINTS = {'ksd', 'kmat', 'make_precon'}
+
+
+class GaussianMixture:
+    """Mixture of two isotropic Gaussians with means at -1 and 1 in every coordinate"""
+
+    def __init__(self, d, weights=(0.3, 0.7), means=(-1., 1.), sd=1.):
+        self.d = d
+        self.log_weights = np.log(np.asarray(weights))
+        self.means = np.outer(means, np.ones(d))
+        self.sd = sd
+
+    def rvs(self, size, rng):
+        components = rng.choice(len(self.log_weights), size=size, p=np.exp(self.log_weights))
+        return self.means[components] + self.sd * rng.normal(size=(size, self.d))
+
+    def _log_components(self, x):
+        sq = np.sum((x[:, np.newaxis, :] - self.means) ** 2, axis=2)
+        return self.log_weights - 0.5 * sq / self.sd ** 2 - self.d * np.log(np.sqrt(2 * np.pi) * self.sd)
+
+    def logpdf(self, x):
+        return logsumexp(self._log_components(x), axis=1)
+
+    def score(self, x):
+        log_f = self._log_components(x)
+        resp = np.exp(log_f - logsumexp(log_f, axis=1, keepdims=True))
+        return (np.dot(resp, self.means) - x) / self.sd ** 2
+
+
+def precon_rank(preconditioner):
+    """Rank of a low-rank preconditioner, or None for other preconditioners"""
+    name, _, rank = preconditioner.partition(':')
+    if name != 'lowrank':
+        return None
+    return int(rank) if rank else 10
+
+
+def make_target(name, n, d, rng):
+    """Draw a sample and return it with the gradient and log density of the target"""
+    if name == 'gauss':
+        sample = rng.normal(size=(n, d))
+        return sample, -sample, -0.5 * np.sum(sample ** 2, axis=1)
+    if name == 'gmm':
+        mixture = GaussianMixture(d)
+        sample = mixture.rvs(n, rng)
+        return sample, mixture.score(sample), mixture.logpdf(sample)
+    raise ValueError(f'Unknown target {name}.')
+
+
+def gaussian_proxy(sample):
+    """Log density and gradient of the Gaussian with the sample mean and covariance"""
+    mean = np.mean(sample, axis=0)
+    prec = np.linalg.inv(np.atleast_2d(np.cov(sample, rowvar=False)))
+    centred = sample - mean
+    log_q = -0.5 * np.einsum('ij,jk,ik->i', centred, prec, centred)
+    return log_q, -np.dot(centred, prec)
+
+
+def run_case(benchmark, sample, gradient, log_p, n_points, preconditioner):
+    """Return a function running the benchmark and computing the KSD of its output"""
+    if benchmark == 'thin':
+        def run():
+            return thin(sample, gradient, n_points, preconditioner=preconditioner)
+
+        def quality(idx):
+            return selection_ksd(sample, gradient, idx, preconditioner=preconditioner)
+    elif benchmark == 'thin_gf':
+        log_q, gradient_q = gaussian_proxy(sample)
+
+        def run():
+            return thin_gf(sample, log_p, log_q, gradient_q, n_points, preconditioner=preconditioner)
+
+        def quality(idx):
+            return selection_ksd(sample, gradient, idx, preconditioner=preconditioner)
+    elif benchmark == 'ksd':
+        integrand = _make_stein_integrand(sample, gradient, preconditioner=preconditioner)
+
+        def run():
+            return ksd(integrand, sample.shape[0])
+
+        def quality(values):
+            return values[-1]
+    elif benchmark == 'kmat':
+        integrand = _make_stein_integrand(sample, gradient, preconditioner=preconditioner)
+
+        def run():
+            return kmat(integrand, sample.shape[0])
+
+        def quality(mat):
+            return np.sqrt(np.sum(mat)) / mat.shape[0]
+    elif benchmark == 'make_precon':
+        def run():
+            return make_precon(sample, preconditioner)
+
+        def quality(_):
+            return None
+    else:
+        raise ValueError(f'Unknown benchmark {benchmark}.')
+    return run, quality
+
+
+def measure(run, quality, repeat):
+    """Measure the best wall time of several runs and the peak memory of one run"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    value = quality(result)
+    return {
+        'time_s': min(times),
+        'peak_mb': peak / 2 ** 20,
+        'ksd': None if value is None else float(value),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(record):
+    return tuple(record[k] for k in ['benchmark', 'target', 'n', 'd', 'n_points', 'preconditioner'])
+
+
+def compare(results, baseline, threshold):
+    """Print the ratios of times and peak memory to a baseline and return the number of regressions"""
+    old = {case_key(record): record for record in baseline['results']}
+    print(f'Comparison with version {baseline["version"]} ({baseline["revision"]}):')
+    print(f'{"benchmark":>12} {"target":>6} {"n":>7} {"d":>4} {"m":>5} {"precon":>9} {"time":>7} {"memory":>7} {"KSD":>7}')
+    regressions = 0
+    for record in results:
+        ref = old.get(case_key(record))
+        if ref is None:
+            continue
+        ratios = [
+            record['time_s'] / ref['time_s'],
+            record['peak_mb'] / ref['peak_mb'] if ref['peak_mb'] > 0 else 1.,
+            record['ksd'] / ref['ksd'] if record['ksd'] is not None and ref['ksd'] else 1.,
+        ]
+        flag = ' *' if max(ratios) > threshold else ''
+        regressions += bool(flag)
+        print(
+            f'{record["benchmark"]:>12} {record["target"]:>6} {record["n"]:>7} {record["d"]:>4}'
+            f' {record["n_points"] or "-":>5} {record["preconditioner"]:>9}'
+            f' {ratios[0]:>7.2f} {ratios[1]:>7.2f} {ratios[2]:>7.2f}{flag}'
+        )
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--benchmarks', nargs='+', default=['thin', 'thin_gf', 'ksd', 'kmat', 'make_precon'])
+    parser.add_argument('--targets', nargs='+', default=['gauss', 'gmm'])
+    parser.add_argument('--n', type=int, nargs='+', default=[1000, 5000], help='sample sizes')
+    parser.add_argument('--d', type=int, nargs='+', default=[2, 10, 200], help='dimensions')
+    parser.add_argument('--n-points', type=int, nargs='+', default=[20, 100], help='numbers of points to select')
+    parser.add_argument('--preconditioners', nargs='+', default=PRECONDITIONERS)
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of each case')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON file with results of a previous run')
+    parser.add_argument('--threshold', type=float, default=1.2, help='ratio to the previous run flagged as regression')
+    args = parser.parse_args()
+
+    results = []
+    for target, n, d in itertools.product(args.targets, args.n, args.d):
+        sample, gradient, log_p = make_target(target, n, d, np.random.default_rng(12345))
+        for benchmark, n_points, preconditioner in itertools.product(
+                args.benchmarks, args.n_points, args.preconditioners):
+            if benchmark in WITHOUT_POINTS:
+                if n_points != args.n_points[0]:
+                    continue
+                n_points = None
+            if (precon_rank(preconditioner) or 0) > d:
+                continue
+            run, quality = run_case(benchmark, sample, gradient, log_p, n_points, preconditioner)
+            record = {
+                'benchmark': benchmark,
+                'target': target,
+                'n': n,
+                'd': d,
+                'n_points': n_points,
+                'preconditioner': preconditioner,
+                **measure(run, quality, args.repeat),
+            }
+            results.append(record)
+            ksd_value = '-' if record['ksd'] is None else f'{record["ksd"]:.5f}'
+            print(
+                f'{benchmark:>12} {target:>6} n={n:<7} d={d:<4} m={n_points or "-":<5} {preconditioner:>9}'
+                f' {record["time_s"]:>9.4f} s {record["peak_mb"]:>9.1f} MB  KSD {ksd_value}',
+                flush=True,
+            )
+
+    report = {
+        'version': stein_thinning.__version__,
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.threshold) > 0 else 0)
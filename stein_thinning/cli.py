@@ -0,0 +1,215 @@
+"""Command-line interface for Stein thinning
+
+Sample and gradient files are read as follows:
+
+- .npy files are memory-mapped, so arrays larger than memory can be thinned;
+- arrays in .npz archives are selected as path.npz:key, which is required
+  when the archive holds more than one array, e.g. `chain.npz:sample` and
+  `--gradient chain.npz:gradient`;
+- any other file is parsed as delimited text in chunks of rows. With
+  --convert-dir, the parsed array is written to a .npy file there and
+  memory-mapped, so that the whole text file is never held in memory, and
+  the .npy file can be passed directly in later runs.
+
+Selected indices are written one per line to standard output or to --output,
+in NumPy format if the file name ends with .npy.
+"""
+
+import argparse
+from itertools import islice
+import os
+from pathlib import Path
+import sys
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# Number of text lines parsed at once
+CSV_CHUNK_LINES = 65536
+
+
+def _count_rows(path: Path, skip_header: int) -> int:
+    """Count non-empty lines of a text file after the header, as parsed by `read_text`"""
+    with open(path, 'rb') as f:
+        for _ in range(skip_header):
+            f.readline()
+        return sum(1 for line in f if line.strip())
+
+
+def read_text(
+        path: Path,
+        delimiter: str = ',',
+        skip_header: int = 0,
+        dtype: np.dtype = np.float64,
+        convert_dir: Optional[Path] = None,
+) -> np.ndarray:
+    """Parse a delimited text file in chunks of rows
+
+    Parameters
+    ----------
+    path: Path
+        text file with one row of the array per line.
+    delimiter: str
+        string separating the values in a row. Default: ','.
+    skip_header: int
+        number of lines to skip at the start of the file. Default: 0.
+    dtype: np.dtype
+        type of the values. Default: np.float64.
+    convert_dir: Optional[Path]
+        if provided, the array is written to a .npy file with the same stem in
+        this directory and returned as a memory-mapped array.
+
+    Returns
+    -------
+    np.ndarray
+        the array stored in the file, with one dimension for a single column.
+    """
+    n = _count_rows(path, skip_header)
+    out = None
+    start = 0
+    with open(path) as f:
+        for _ in range(skip_header):
+            f.readline()
+        while True:
+            lines = [line for line in islice(f, CSV_CHUNK_LINES) if line.strip()]
+            if not lines:
+                break
+            chunk = np.loadtxt(lines, delimiter=delimiter, dtype=dtype, ndmin=2)
+            if out is None:
+                shape = (n, chunk.shape[1])
+                if convert_dir is None:
+                    out = np.empty(shape, dtype=dtype)
+                else:
+                    out = np.lib.format.open_memmap(
+                        Path(convert_dir) / (path.stem + '.npy'), mode='w+', dtype=dtype, shape=shape,
+                    )
+            out[start:start + chunk.shape[0]] = chunk
+            start += chunk.shape[0]
+    assert out is not None, f'{path} contains no data.'
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out[:, 0] if out.shape[1] == 1 else out
+
+
+def _split_key(path: str) -> Tuple[Path, Optional[str]]:
+    """Split a path of the form path.npz:key into the path and the array name"""
+    head, sep, key = path.rpartition(':')
+    if sep and head.lower().endswith('.npz') and not os.path.exists(path):
+        return Path(head), key
+    return Path(path), None
+
+
+def read_array(path: str, args: argparse.Namespace) -> np.ndarray:
+    """Read an array from a .npy, .npz or delimited text file"""
+    path, key = _split_key(path)
+    suffix = path.suffix.lower()
+    if suffix == '.npy':
+        return np.load(path, mmap_mode='r')
+    if suffix == '.npz':
+        with np.load(path) as archive:
+            if key is None:
+                if len(archive.files) != 1:
+                    raise ValueError(f'{path} holds the arrays {", ".join(archive.files)}; select one as {path}:key.')
+                key = archive.files[0]
+            if key not in archive.files:
+                raise ValueError(f'{path} has no array {key}.')
+            return archive[key]
+    assert key is None, f'Array names are only supported for .npz files: {path}:{key}.'
+    return read_text(
+        path, delimiter=args.delimiter, skip_header=args.skip_header, dtype=np.dtype(args.dtype or np.float64),
+        convert_dir=args.convert_dir,
+    )
+
+
+def write_array(arr: np.ndarray, path: Optional[str], fmt: str):
+    """Write an array to a .npy file, a text file or standard output"""
+    if path is None or path == '-':
+        np.savetxt(sys.stdout, arr, fmt=fmt)
+    elif path.lower().endswith('.npy'):
+        np.save(path, arr)
+    else:
+        np.savetxt(path, arr, fmt=fmt)
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='stein-thinning',
+        description='Select a subset of points from a sample by minimising the kernel Stein discrepancy.',
+        epilog=__doc__.split('\n\n', 1)[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('sample', help='file containing the n x d sample')
+    parser.add_argument('n_points', type=int, help='number of points to select')
+    inputs = parser.add_argument_group('gradients', 'Either --gradient, or --log-p, --log-q and --gradient-q for gradient-free thinning.')
+    inputs.add_argument('--gradient', help='file containing the gradients of the log target at the sample points')
+    inputs.add_argument('--log-p', help='file containing the log target density at the sample points')
+    inputs.add_argument('--log-q', help='file containing the log proxy density at the sample points')
+    inputs.add_argument('--gradient-q', help='file containing the gradients of the log proxy density')
+    options = parser.add_argument_group('thinning options')
+    options.add_argument('--no-standardize', dest='standardize', action='store_false', help='do not standardise the sample')
+    options.add_argument('--preconditioner', default='id', help="'id' (default), 'med', 'sclmed', 'smpcov', 'smpvar', 'lowrank[:rank]' or a number")
+    options.add_argument('--range-cap', type=float, help='cap on the range of log_q - log_p (gradient-free only)')
+    options.add_argument('--block-size', type=int, help='number of rows of a kernel column evaluated at once')
+    options.add_argument('--threads', type=int, help='number of threads (or processes, see --backend)')
+    options.add_argument('--backend', choices=['thread', 'process'], default='thread', help='type of workers')
+    options.add_argument('--dtype', choices=['float32', 'float64'], help='floating-point type of the kernel')
+    options.add_argument('--target-ksd', type=float, help='stop when the KSD of the selection reaches this value')
+    options.add_argument('--rtol', type=float, help='stop when a point improves the KSD by less than this fraction')
+    options.add_argument('--deduplicate', action='store_true', help='search the distinct rows only (with --gradient only)')
+    io = parser.add_argument_group('input and output')
+    io.add_argument('--delimiter', default=',', help="delimiter of text files (default: ',')")
+    io.add_argument('--skip-header', type=int, default=0, help='number of header lines of text files')
+    io.add_argument('--convert-dir', type=Path, help='directory for .npy copies of text inputs')
+    io.add_argument('-o', '--output', help='file for the selected indices (default: standard output)')
+    io.add_argument('--ksd-output', help='file for the KSD of each initial part of the selection')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    gradient_free = [args.log_p, args.log_q, args.gradient_q]
+    if args.gradient is None and not all(gradient_free):
+        parser.error('either --gradient or all of --log-p, --log-q and --gradient-q are required')
+    if args.gradient is not None and any(gradient_free):
+        parser.error('--gradient cannot be combined with gradient-free inputs')
+    if args.convert_dir is not None:
+        os.makedirs(args.convert_dir, exist_ok=True)
+
+    # Imported here to keep start-up fast when only parsing arguments
+    from stein_thinning.thinning import thin, thin_gf
+
+    options = dict(
+        standardize=args.standardize,
+        preconditioner=args.preconditioner,
+        block_size=args.block_size,
+        n_jobs=args.threads,
+        dtype=args.dtype,
+        backend=args.backend,
+        target_ksd=args.target_ksd,
+        rtol=args.rtol,
+        return_ksd=True,
+    )
+    if args.gradient is None and args.deduplicate:
+        parser.error('--deduplicate requires --gradient')
+    try:
+        sample = read_array(args.sample, args)
+        if args.gradient is not None:
+            gradient = read_array(args.gradient, args)
+        else:
+            log_p, log_q, gradient_q = (read_array(path, args) for path in gradient_free)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.gradient is not None:
+        idx, ksd = thin(sample, gradient, args.n_points, deduplicate=args.deduplicate, **options)
+    else:
+        idx, ksd = thin_gf(sample, log_p, log_q, gradient_q, args.n_points, range_cap=args.range_cap, **options)
+    write_array(idx, args.output, '%d')
+    if args.ksd_output is not None:
+        write_array(ksd, args.ksd_output, '%.10g')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,5 @@
 """Post-process output from Stan."""
 
-import numpy as np
 import matplotlib.pyplot as plt
 
 import stan
@@ -15,12 +14,11 @@ if __name__ == '__main__':
     sm = stan.build(mc, random_seed=12345)
     fit = sm.sample(num_samples=1000)
 
-    # Extract sampled points and gradients
+    # Extract sampled points
     sample = fit['x'].T
-    gradient = np.apply_along_axis(lambda x: sm.grad_log_prob(x.tolist()), 1, sample)
 
-    # Obtain a subset of 40 points
-    idx = thin(sample, gradient, 40)
+    # Obtain a subset of 40 points, evaluating gradients at distinct points on 4 threads
+    idx = thin(sample, lambda x: sm.grad_log_prob(x.tolist()), 40, n_jobs=4)
 
     # Plot point-set over trace
     plt.figure()
@@ -1,17 +1,191 @@
 """Kernel definitions"""
 
+import copy
+from typing import Any, Callable, List, Optional, Tuple
+
 import numpy as np
-from numpy.linalg import inv
-from numpy.linalg import eig
+from numpy.linalg import LinAlgError, cholesky, eigh, qr
+from scipy.linalg import solve_triangular
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import pdist
 
 
+class Preconditioner:
+    """Symmetric positive definite d x d preconditioner matrix P with structure
+
+    Kernels only need products of P with points and its trace, which
+    subclasses compute without forming P when it is a scaled identity,
+    diagonal, a product of factors or diagonal plus low rank.
+    """
+
+    d: int
+
+    def dot(self, x: np.ndarray) -> np.ndarray:
+        """Multiply rows of `x` (or a vector) by P"""
+        raise NotImplementedError
+
+    def sqrt_dot(self, x: np.ndarray) -> np.ndarray:
+        """Multiply rows of `x` by a factor F with FF' = P, so that |(x - y)F|^2 = (x - y)'P(x - y)"""
+        return np.dot(x, cholesky(self.dense()))
+
+    def trace(self) -> float:
+        raise NotImplementedError
+
+    def dense(self) -> np.ndarray:
+        """Return P as a d x d array"""
+        return self.dot(np.identity(self.d))
+
+    def astype(self, dtype: Any) -> 'Preconditioner':
+        """Return the preconditioner with arrays of the given floating-point type"""
+        raise NotImplementedError
+
+    def state(self) -> dict:
+        """Return the arguments of the constructor, so that `type(self)(**state)` recreates the preconditioner"""
+        raise NotImplementedError
+
+
+class DensePreconditioner(Preconditioner):
+    """Preconditioner stored as a d x d array"""
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = np.asarray(matrix)
+        self.d = self.matrix.shape[0]
+
+    def dot(self, x: np.ndarray) -> np.ndarray:
+        return np.dot(x, self.matrix)
+
+    def trace(self) -> float:
+        return float(np.trace(self.matrix))
+
+    def dense(self) -> np.ndarray:
+        return self.matrix
+
+    def astype(self, dtype: Any) -> 'DensePreconditioner':
+        return DensePreconditioner(self.matrix.astype(dtype, copy=False))
+
+    def state(self) -> dict:
+        return {'matrix': self.matrix}
+
+
+class ScalarPreconditioner(Preconditioner):
+    """Preconditioner P = value * I"""
+
+    def __init__(self, value: float, d: int):
+        self.value = np.asarray(value)
+        self.d = int(d)
+
+    def dot(self, x: np.ndarray) -> np.ndarray:
+        return x * self.value
+
+    def sqrt_dot(self, x: np.ndarray) -> np.ndarray:
+        return x * np.sqrt(self.value)
+
+    def trace(self) -> float:
+        return float(self.value) * self.d
+
+    def astype(self, dtype: Any) -> 'ScalarPreconditioner':
+        return ScalarPreconditioner(self.value.astype(dtype), self.d)
+
+    def state(self) -> dict:
+        return {'value': self.value, 'd': self.d}
+
+
+class DiagonalPreconditioner(Preconditioner):
+    """Preconditioner P = diag(diagonal)"""
+
+    def __init__(self, diagonal: np.ndarray):
+        self.diagonal = np.asarray(diagonal)
+        self.d = self.diagonal.shape[0]
+
+    def dot(self, x: np.ndarray) -> np.ndarray:
+        return x * self.diagonal
+
+    def sqrt_dot(self, x: np.ndarray) -> np.ndarray:
+        return x * np.sqrt(self.diagonal)
+
+    def trace(self) -> float:
+        return float(np.sum(self.diagonal))
+
+    def astype(self, dtype: Any) -> 'DiagonalPreconditioner':
+        return DiagonalPreconditioner(self.diagonal.astype(dtype, copy=False))
+
+    def state(self) -> dict:
+        return {'diagonal': self.diagonal}
+
+
+class CholeskyPreconditioner(Preconditioner):
+    """Preconditioner P = FF' given by a d x d factor F, e.g. a triangular one"""
+
+    def __init__(self, factor: np.ndarray):
+        self.factor = np.asarray(factor)
+        self.d = self.factor.shape[0]
+
+    def dot(self, x: np.ndarray) -> np.ndarray:
+        return np.dot(np.dot(x, self.factor), self.factor.T)
+
+    def sqrt_dot(self, x: np.ndarray) -> np.ndarray:
+        return np.dot(x, self.factor)
+
+    def trace(self) -> float:
+        return float(np.sum(self.factor ** 2))
+
+    def astype(self, dtype: Any) -> 'CholeskyPreconditioner':
+        return CholeskyPreconditioner(self.factor.astype(dtype, copy=False))
+
+    def state(self) -> dict:
+        return {'factor': self.factor}
+
+
+class LowRankPreconditioner(Preconditioner):
+    """Preconditioner P = diag(diagonal) + U diag(weights) U' for a d x r matrix U
+
+    Products cost O(dr) per point. `weights` may be negative as long as P is
+    positive definite.
+    """
+
+    def __init__(self, diagonal: np.ndarray, factor: np.ndarray, weights: np.ndarray):
+        self.diagonal = np.asarray(diagonal)
+        self.factor = np.asarray(factor)
+        self.weights = np.asarray(weights)
+        self.d = self.diagonal.shape[0]
+
+    def dot(self, x: np.ndarray) -> np.ndarray:
+        return x * self.diagonal + np.dot(np.dot(x, self.factor) * self.weights, self.factor.T)
+
+    def trace(self) -> float:
+        return float(np.sum(self.diagonal) + np.sum(self.weights * np.sum(self.factor ** 2, axis=0)))
+
+    def astype(self, dtype: Any) -> 'LowRankPreconditioner':
+        return LowRankPreconditioner(
+            self.diagonal.astype(dtype, copy=False),
+            self.factor.astype(dtype, copy=False),
+            self.weights.astype(dtype, copy=False),
+        )
+
+    def state(self) -> dict:
+        return {'diagonal': self.diagonal, 'factor': self.factor, 'weights': self.weights}
+
+
+PRECONDITIONER_TYPES = {
+    cls.__name__: cls for cls in [
+        DensePreconditioner, ScalarPreconditioner, DiagonalPreconditioner, CholeskyPreconditioner, LowRankPreconditioner,
+    ]
+}
+
+
+def as_preconditioner(linv: np.ndarray | Preconditioner) -> Preconditioner:
+    """Wrap a d x d preconditioner matrix, leaving structured preconditioners unchanged"""
+    if isinstance(linv, Preconditioner):
+        return linv
+    return DensePreconditioner(linv)
+
+
 def vfk0_imq(
         x: np.ndarray,
         y: np.ndarray,
         sx: np.ndarray,
         sy: np.ndarray,
-        linv: np.ndarray,
+        linv: np.ndarray | Preconditioner,
         c: float = 1.0,
         beta: float = -0.5,
     ) -> np.ndarray:
@@ -38,8 +212,8 @@ def vfk0_imq(
         n x d array where each row is a d-dimensional gradient calculated at
         the corresponding point in `y`. Alternatively, 1 x d array that will be
         broadcast with `sx`.
-    linv: np.ndarray
-        d x d preconditioner matrix.
+    linv: np.ndarray | Preconditioner
+        d x d preconditioner matrix, or a structured preconditioner.
     c: float
         parameter of the inverse multiquadratic kernel. Default: 1.0.
     beta: float
@@ -50,14 +224,94 @@ def vfk0_imq(
     np.ndarray
         array of length n with values of the kernel evaluated for each pair of points
     """
-    xmy = x.T - y.T
-    qf = c + np.sum(np.dot(linv, xmy) * xmy, axis=0)
-    t1 = -4 * beta * (beta - 1) * np.sum(np.dot(np.dot(linv, linv), xmy) * xmy, axis=0) / (qf ** (-beta + 2))
-    t2 = -2 * beta * (np.trace(linv) + np.sum(np.dot(linv, sx.T - sy.T) * xmy, axis=0)) / (qf ** (-beta + 1))
-    t3 = np.sum(sx.T * sy.T, axis=0) / (qf ** (-beta))
+    precon = as_preconditioner(linv)
+    xmy = x - y
+    pxmy = precon.dot(xmy)
+    qf = c + np.sum(pxmy * xmy, axis=-1)
+    t1 = -4 * beta * (beta - 1) * np.sum(pxmy * pxmy, axis=-1) / (qf ** (-beta + 2))
+    t2 = -2 * beta * (precon.trace() + np.sum(pxmy * (sx - sy), axis=-1)) / (qf ** (-beta + 1))
+    t3 = np.sum(sx * sy, axis=-1) / (qf ** (-beta))
+    return t1 + t2 + t3
+
+
+def _wendland_exponent(d: int, ell: Optional[int]) -> int:
+    """Exponent of the Wendland function, the smallest one valid in d dimensions by default"""
+    if ell is None:
+        ell = d // 2 + 2
+    assert ell >= d // 2 + 2, 'Wendland kernel is not positive definite for this exponent.'
+    return ell + 1
+
+
+def vfk0_wendland(
+        x: np.ndarray,
+        y: np.ndarray,
+        sx: np.ndarray,
+        sy: np.ndarray,
+        linv: np.ndarray | Preconditioner,
+        ell: Optional[int] = None,
+    ) -> np.ndarray:
+    """Evaluate Stein kernel based on compactly supported Wendland kernel
+
+    The base kernel is the twice continuously differentiable Wendland function
+    k(x, y) = (1 - r)_+^a (a r + 1), where r^2 = (x-y)'P(x-y), P is the
+    preconditioner matrix and a = ell + 1. The Stein kernel vanishes for pairs
+    of points with r >= 1.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        n x d array where each row is a d-dimensional sample point for the first
+        argument of the kernel. Alternatively, 1 x d array that will be broadcast
+        with `y`.
+    y: np.ndarray
+        n x d array where each row is a d-dimensional sample point for the second
+        argument of the kernel. Alternatively, 1 x d array that will be broadcast
+        with `x`.
+    sx: np.ndarray
+        n x d array where each row is a d-dimensional gradient calculated at
+        the corresponding point in `x`. Alternatively, 1 x d array that will be
+        broadcast with `sy`.
+    sy: np.ndarray
+        n x d array where each row is a d-dimensional gradient calculated at
+        the corresponding point in `y`. Alternatively, 1 x d array that will be
+        broadcast with `sx`.
+    linv: np.ndarray | Preconditioner
+        d x d preconditioner matrix, or a structured preconditioner.
+    ell: Optional[int]
+        exponent parameter of the Wendland function, at least d // 2 + 2 (the
+        default) for the kernel to be positive definite in d dimensions.
+
+    Returns
+    -------
+    np.ndarray
+        array of length n with values of the kernel evaluated for each pair of points
+    """
+    precon = as_preconditioner(linv)
+    a = _wendland_exponent(x.shape[-1], ell)
+    xmy = x - y
+    pxmy = precon.dot(xmy)
+    r = np.sqrt(np.maximum(np.sum(pxmy * xmy, axis=-1), 0))
+    w = np.maximum(1 - r, 0)
+    # (x-y)'PP(x-y) / r, which tends to 0 as x approaches y
+    rpp = np.divide(np.sum(pxmy * pxmy, axis=-1), r, out=np.zeros_like(r), where=r > 0)
+    t1 = a * (a + 1) * w ** (a - 2) * (precon.trace() * w - (a - 1) * rpp)
+    t2 = a * (a + 1) * w ** (a - 1) * np.sum(pxmy * (sx - sy), axis=-1)
+    t3 = w ** a * (a * r + 1) * np.sum(sx * sy, axis=-1)
     return t1 + t2 + t3
 
 
+# Number of array elements processed at once when scanning a whole sample
+CHUNK_ELEMENTS = 2 ** 20
+
+
+def _row_blocks(n: int, block_size: Optional[int]) -> List[slice]:
+    """Split n rows into consecutive blocks of at most `block_size` rows"""
+    if block_size is None:
+        block_size = n
+    assert block_size > 0, 'block_size must be positive.'
+    return [slice(start, min(start + block_size, n)) for start in range(0, n, block_size)]
+
+
 def _isfloat(value):
     """Test if value can be converted to float"""
     try:
@@ -67,7 +321,98 @@ def _isfloat(value):
         return False
 
 
-def make_precon(sample: np.ndarray, preconditioner: str = 'id') -> np.ndarray:
+def _covariance(sample: np.ndarray) -> np.ndarray:
+    """Compute the sample covariance matrix, reading the sample in chunks"""
+    n, d = sample.shape
+    blocks = _row_blocks(n, max(1, CHUNK_ELEMENTS // d))
+    mean = sum(np.sum(sample[rows], axis=0, dtype=np.float64) for rows in blocks) / n
+    c = np.zeros((d, d))
+    for rows in blocks:
+        centred = sample[rows] - mean
+        c += np.dot(centred.T, centred)
+    return c / (n - 1)
+
+
+def _variance(sample: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the sample mean and variance of each column, reading the sample in chunks"""
+    n, d = sample.shape
+    blocks = _row_blocks(n, max(1, CHUNK_ELEMENTS // d))
+    mean = sum(np.sum(sample[rows], axis=0, dtype=np.float64) for rows in blocks) / n
+    var = sum(np.sum((sample[rows] - mean) ** 2, axis=0) for rows in blocks) / (n - 1)
+    return mean, var
+
+
+def _principal_components(
+        sample: np.ndarray,
+        mean: np.ndarray,
+        rank: int,
+        scale: Optional[np.ndarray] = None,
+        n_iter: int = 4,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Estimate the largest eigenvalues and eigenvectors of the sample covariance matrix
+
+    Randomised subspace iteration with a few extra vectors: every product
+    with the covariance matrix is a pass over the sample in chunks, so the
+    cost is O(ndr) without forming the d x d matrix.
+    """
+    n, d = sample.shape
+    blocks = _row_blocks(n, max(1, CHUNK_ELEMENTS // d))
+
+    def cov_dot(v):
+        out = np.zeros_like(v)
+        for rows in blocks:
+            centred = sample[rows] - mean
+            if scale is not None:
+                centred /= scale
+            out += np.dot(centred.T, np.dot(centred, v))
+        return out / (n - 1)
+
+    k = min(d, rank + 10)
+    q, _ = qr(np.random.default_rng(12345).normal(size=(d, k)))
+    for _ in range(n_iter):
+        q, _ = qr(cov_dot(q))
+    values, vectors = eigh(np.dot(q.T, cov_dot(q)))
+    order = np.argsort(values)[::-1][:rank]
+    return values[order], np.dot(q, vectors[:, order])
+
+
+def _cholesky_precision(c: np.ndarray) -> CholeskyPreconditioner:
+    """Inverse of a covariance matrix, as the factor of its Cholesky decomposition"""
+    try:
+        lower = cholesky(c)
+    except LinAlgError:
+        lower = None
+    assert lower is not None, 'Covariance matrix of sample is singular.'
+    # Inverse of C = LL' is FF' with F = L'^-1
+    return CholeskyPreconditioner(solve_triangular(lower, np.identity(c.shape[0]), lower=True).T)
+
+
+def _low_rank_precision(sample: np.ndarray, rank: int, scale: Optional[np.ndarray] = None) -> LowRankPreconditioner:
+    """Inverse of a diagonal plus low-rank approximation of the sample covariance matrix
+
+    The covariance is approximated by VLV' + D, where VLV' is given by the
+    leading principal components and D by the remaining variance of each
+    coordinate, and inverted with the Woodbury identity.
+    """
+    mean, var = _variance(sample)
+    if scale is not None:
+        var /= scale ** 2
+    assert np.all(var > 0), 'Too few unique samples.'
+    values, vectors = _principal_components(sample, mean, rank, scale=scale)
+    assert np.all(values > 0), 'Covariance matrix of sample is singular.'
+    residual = np.maximum(var - np.dot(vectors ** 2, values), 1e-6 * var)
+    # (D + VLV')^-1 = D^-1 - D^-1 V (L^-1 + V'D^-1V)^-1 V'D^-1
+    dv = vectors / residual[:, np.newaxis]
+    inner, rotation = eigh(np.diag(1 / values) + np.dot(vectors.T, dv))
+    return LowRankPreconditioner(1 / residual, np.dot(dv, rotation), -1 / inner)
+
+
+def make_precon(
+        sample: np.ndarray,
+        preconditioner: str = 'id',
+        scale: Optional[np.ndarray] = None,
+        structured: bool = False,
+) -> np.ndarray | Preconditioner:
     """Create preconditioner matrix
 
     Parameters
@@ -75,16 +420,38 @@ def make_precon(sample: np.ndarray, preconditioner: str = 'id') -> np.ndarray:
     sample: np.ndarray
         n x d array where each row is a d-dimensional sample point.
     preconditioner: str
-        optional string, either 'id' (default), 'med', 'sclmed', or
-        'smpcov', specifying the preconditioner to be used. Alternatively,
-        a numeric string can be passed as the single length-scale parameter
-        of an isotropic kernel.
+        optional string, either 'id' (default), 'med', 'sclmed', 'smpcov',
+        'smpvar' or 'lowrank', specifying the preconditioner to be used.
+        'smpvar' is the inverse of the diagonal of the sample covariance
+        matrix, and 'lowrank' (or 'lowrank:r') the inverse of its
+        approximation by the r leading principal components (default: 10)
+        plus a diagonal, which cost O(nd) and O(ndr) rather than O(nd^2)
+        to set up. Alternatively, a numeric string can be passed as the
+        single length-scale parameter of an isotropic kernel.
+    scale: Optional[np.ndarray]
+        if provided, the preconditioner is created for `sample / scale`
+        without forming this array.
+    structured: bool
+        whether to return a `Preconditioner` that kernels apply to a point in
+        O(d) operations for 'id', 'med', 'sclmed', 'smpvar' and numeric
+        length-scales, and O(dr) for 'lowrank', instead of a d x d array.
+        Default: False.
 
     Returns
     -------
-    np.ndarray
-        d x d array containing the preconditioner matrix
+    np.ndarray | Preconditioner
+        d x d array containing the preconditioner matrix, or the structured
+        preconditioner if `structured` is True.
     """
+    precon = _make_structured_precon(sample, preconditioner, scale)
+    return precon if structured else precon.dense()
+
+
+def _make_structured_precon(
+        sample: np.ndarray,
+        preconditioner: str = 'id',
+        scale: Optional[np.ndarray] = None,
+) -> Preconditioner:
     # Sample size and dimension
     N, d = sample.shape
 
@@ -94,32 +461,750 @@ def make_precon(sample: np.ndarray, preconditioner: str = 'id') -> np.ndarray:
             sub = sample[np.linspace(0, N - 1, m, dtype=int)]
         else:
             sub = sample
+        if scale is not None:
+            sub = sub / scale
         return np.median(pdist(sub)) ** 2
 
     # Select preconditioner
     m = 1000
     if preconditioner == 'id':
-        return np.identity(d)
+        return ScalarPreconditioner(1., d)
     elif preconditioner == 'med':
         m2 = med2(m)
         assert m2 > 0, 'Too few unique samples.'
-        return np.identity(d) / m2
+        return ScalarPreconditioner(1 / m2, d)
     elif preconditioner == 'sclmed':
         m2 = med2(m)
         assert m2 > 0, 'Too few unique samples.'
-        return np.identity(d) / m2 * np.log(np.minimum(m, N))
+        return ScalarPreconditioner(np.log(np.minimum(m, N)) / m2, d)
     elif preconditioner == 'smpcov':
-        c = np.cov(sample, rowvar=False)
-        assert np.all(eig(c)[0] > 0), 'Covariance matrix of sample is singular.'
-        return inv(c)
+        c = _covariance(sample)
+        if scale is not None:
+            c /= np.outer(scale, scale)
+        return _cholesky_precision(c)
+    elif preconditioner == 'smpvar':
+        _, var = _variance(sample)
+        if scale is not None:
+            var /= scale ** 2
+        assert np.all(var > 0), 'Too few unique samples.'
+        return DiagonalPreconditioner(1 / var)
+    elif isinstance(preconditioner, str) and preconditioner.split(':')[0] == 'lowrank':
+        rank = int(preconditioner.split(':')[1]) if ':' in preconditioner else 10
+        assert 0 < rank <= d, 'Rank of the preconditioner must be between 1 and d.'
+        return _low_rank_precision(sample, rank, scale=scale)
     elif _isfloat(preconditioner):
-        return np.identity(d) / float(preconditioner)
+        return ScalarPreconditioner(1 / float(preconditioner), d)
     else:
         raise ValueError('Incorrect preconditioner type.')
 
 
 def make_imq(sample: np.ndarray, preconditioner: str = 'id'):
-    preconditioner = make_precon(sample, preconditioner)
+    preconditioner = make_precon(sample, preconditioner, structured=True)
     def vfk0(sample1, sample2, gradient1, gradient2):
         return vfk0_imq(sample1, sample2, gradient1, gradient2, preconditioner)
     return vfk0
+
+
+def make_wendland(sample: np.ndarray, preconditioner: str = 'id', ell: Optional[int] = None):
+    preconditioner = make_precon(sample, preconditioner, structured=True)
+    def vfk0(sample1, sample2, gradient1, gradient2):
+        return vfk0_wendland(sample1, sample2, gradient1, gradient2, preconditioner, ell=ell)
+    return vfk0
+
+
+class KernelPlan:
+    """Stein kernel prepared for evaluation on a fixed sample of n points
+
+    A kernel plan can be used wherever an integrand is expected, i.e. called
+    with a pair of indexers into the sample. In addition, it evaluates the
+    diagonal and individual columns of the Stein kernel matrix, which is
+    all the greedy search needs. Subclasses override `column` with more
+    efficient implementations where possible.
+
+    Kernel values are computed in the floating-point type `dtype`.
+    """
+
+    n: int
+    dtype: np.dtype = np.dtype(np.float64)
+
+    def __call__(self, ind1: Any, ind2: Any) -> np.ndarray:
+        """Evaluate the Stein kernel for pairs of points identified by two indexers"""
+        raise NotImplementedError
+
+    def workspace(self, size: int) -> Optional[np.ndarray]:
+        """Allocate a scratch array for evaluating columns of up to `size` rows"""
+        return None
+
+    def diagonal(self, rows: Any = slice(None)) -> np.ndarray:
+        """Evaluate the Stein kernel at pairs of identical points
+
+        Parameters
+        ----------
+        rows: Any
+            indexer selecting the points to evaluate. Default: all points.
+
+        Returns
+        -------
+        np.ndarray
+            the selected elements of the diagonal of the Stein kernel matrix.
+        """
+        return self(rows, rows)
+
+    def column(
+            self,
+            j: int,
+            rows: Any = slice(None),
+            out: Optional[np.ndarray] = None,
+            work: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Evaluate a column of the Stein kernel matrix
+
+        Parameters
+        ----------
+        j: int
+            index of the point defining the column.
+        rows: Any
+            indexer selecting the rows to evaluate. Default: all rows.
+        out: Optional[np.ndarray]
+            array to write the result to, with one element per selected row.
+        work: Optional[np.ndarray]
+            scratch array as returned by `workspace` with at least as many
+            columns as there are selected rows.
+
+        Returns
+        -------
+        np.ndarray
+            values of the Stein kernel between the selected rows and point `j`.
+        """
+        vals = self(rows, [j])
+        if out is None:
+            return vals
+        out[:] = vals
+        return out
+
+    def block(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Evaluate a block of the Stein kernel matrix
+
+        Parameters
+        ----------
+        rows: np.ndarray
+            indices of the rows of the block.
+        cols: np.ndarray
+            indices of the columns of the block.
+
+        Returns
+        -------
+        np.ndarray
+            len(rows) x len(cols) array of values of the Stein kernel.
+        """
+        ind1, ind2 = np.meshgrid(rows, cols, indexing='ij')
+        return self(ind1.ravel(), ind2.ravel()).reshape(ind1.shape)
+
+    def columns(self, cols: np.ndarray, rows: slice = slice(None)) -> np.ndarray:
+        """Evaluate several columns of the Stein kernel matrix together
+
+        Parameters
+        ----------
+        cols: np.ndarray
+            indices of the points defining the columns.
+        rows: slice
+            range of rows to evaluate. Default: all rows.
+
+        Returns
+        -------
+        np.ndarray
+            len(cols) x len(rows) array of values of the Stein kernel, one column per row.
+        """
+        return self.block(cols, np.arange(self.n)[rows])
+
+    def subset(self, indices: np.ndarray) -> 'KernelPlan':
+        """Restrict the plan to a subset of the points
+
+        The kernel itself, including standardisation and preconditioner, is
+        unchanged, so the kernel matrix of the returned plan is the submatrix
+        of the kernel matrix of this plan for rows and columns `indices`.
+
+        Parameters
+        ----------
+        indices: np.ndarray
+            indices of the points to keep.
+
+        Returns
+        -------
+        KernelPlan
+            kernel plan for the points `indices`, numbered from 0.
+        """
+        raise NotImplementedError
+
+
+class PairwiseKernelPlan(KernelPlan):
+    """Kernel plan evaluating a vectorised Stein kernel function on pairs of points
+
+    Parameters
+    ----------
+    vfk0: Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+        vectorised Stein kernel taking two arrays of points followed by the
+        two arrays of gradients at these points.
+    sample: np.ndarray
+        n x d array where each row is a sample point.
+    gradient: np.ndarray
+        n x d array where each row is a gradient of the log target.
+    scale: Optional[np.ndarray]
+        if provided, the kernel is evaluated for the points `sample / scale`
+        with gradients `gradient * scale`.
+    """
+
+    def __init__(
+            self,
+            vfk0: Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray],
+            sample: np.ndarray,
+            gradient: np.ndarray,
+            scale: Optional[np.ndarray] = None,
+    ):
+        self.vfk0 = vfk0
+        self.sample = sample
+        self.gradient = gradient
+        self.scale = scale
+        self.n = sample.shape[0]
+        self.dtype = np.result_type(sample.dtype, gradient.dtype, np.float32)
+
+    def _points(self, ind: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Return standardised points and gradients for an indexer"""
+        x = self.sample[ind]
+        s = self.gradient[ind]
+        if self.scale is not None:
+            x = x / self.scale
+            s = s * self.scale
+        return x, s
+
+    def __call__(self, ind1: Any, ind2: Any) -> np.ndarray:
+        x1, s1 = self._points(ind1)
+        x2, s2 = self._points(ind2)
+        return self.vfk0(x1, x2, s1, s2)
+
+    def subset(self, indices: np.ndarray) -> 'PairwiseKernelPlan':
+        return PairwiseKernelPlan(self.vfk0, self.sample[indices], self.gradient[indices], scale=self.scale)
+
+
+def _imq_combine(qf, r, u, sts, trace, beta):
+    """Assemble values of the IMQ Stein kernel from quadratic forms in x - y
+
+    Parameters are c + (x-y)'P(x-y), (x-y)'PP(x-y), (sx-sy)'P(x-y) and sx'sy,
+    the trace of P and the exponent of the kernel.
+    """
+    t1 = -4 * beta * (beta - 1) * r / (qf ** (-beta + 2))
+    t2 = -2 * beta * (trace + u) / (qf ** (-beta + 1))
+    t3 = sts / (qf ** (-beta))
+    return t1 + t2 + t3
+
+
+class ImqKernelPlan(KernelPlan):
+    """Stein kernel based on inverse multiquadratic kernel, prepared for a fixed sample
+
+    All quantities that do not depend on the pair of points being evaluated
+    are computed once: per-point quadratic forms and the trace of the
+    preconditioner. Writing the quadratic forms in `vfk0_imq` as sums of
+    inner products, a column of the Stein kernel matrix then costs two
+    passes over the sample and the gradients, each a product with a
+    d x 3 or d x 2 matrix, rather than d x d x n products per call. With a
+    structured preconditioner (see `make_precon`), setting the plan up costs
+    O(nd) for a diagonal one and O(ndr) for diagonal plus rank r rather than
+    O(nd^2).
+
+    Standardisation is applied inside these products, so `sample` and
+    `gradient` are only read and can be memory-mapped arrays. The kernel is
+    computed in single precision if both arrays are of type np.float32, or
+    if `dtype` is np.float32, in which case each block of points is
+    converted after it is centred.
+
+    Expanding (x-y)'P(x-y) into x'Px - 2x'Py + y'Py loses precision when the
+    points are far from the origin relative to their spread. As the kernel
+    only depends on differences of points, the sample mean is subtracted
+    from each block of points before the products are formed.
+
+    Parameters
+    ----------
+    sample: np.ndarray
+        n x d array where each row is a sample point.
+    gradient: np.ndarray
+        n x d array where each row is a gradient of the log target.
+    linv: np.ndarray | Preconditioner
+        d x d preconditioner matrix, or a structured preconditioner.
+    c: float
+        parameter of the inverse multiquadratic kernel. Default: 1.0.
+    beta: float
+        exponent of the inverse multiquadratic kernel. Default: -0.5.
+    scale: Optional[np.ndarray]
+        if provided, the kernel is evaluated for the points `sample / scale`
+        with gradients `gradient * scale`.
+    dtype: Any
+        floating-point type used to evaluate the kernel. By default, the type
+        of the arrays is used.
+    """
+
+    # Number of scratch elements per row used by `column`, besides copies of the centred points
+    # and, if they are of another type, the gradients
+    WORKSPACE_ROWS = 6
+
+    def __init__(
+            self,
+            sample: np.ndarray,
+            gradient: np.ndarray,
+            linv: np.ndarray | Preconditioner,
+            c: float = 1.0,
+            beta: float = -0.5,
+            scale: Optional[np.ndarray] = None,
+            dtype: Any = None,
+    ):
+        self.sample = sample
+        self.gradient = gradient
+        if dtype is None:
+            dtype = np.result_type(sample.dtype, gradient.dtype, np.float32)
+        self.dtype = np.dtype(dtype)
+        self.linv = as_preconditioner(linv).astype(self.dtype)
+        self.c = c
+        self.beta = beta
+        self.scale = None if scale is None else np.asarray(scale, dtype=self.dtype)
+        self.n, self.d = sample.shape
+        d = self.d
+        self.trace = as_preconditioner(linv).trace()
+        blocks = _row_blocks(self.n, max(1, CHUNK_ELEMENTS // d))
+        self.offset = np.asarray(
+            sum(np.sum(sample[rows], axis=0, dtype=np.float64) for rows in blocks) / self.n,
+            dtype=np.result_type(sample.dtype, np.float32),
+        )
+        # Per-point inner products: x'Px, x'PPx, s'Px and s's
+        self.xpx = np.empty(self.n, dtype=self.dtype)
+        self.xppx = np.empty(self.n, dtype=self.dtype)
+        self.spx = np.empty(self.n, dtype=self.dtype)
+        self.sts = np.empty(self.n, dtype=self.dtype)
+        for rows in blocks:
+            x, s = self._points(rows)
+            px = self.linv.dot(x)
+            self.xpx[rows] = np.einsum('ij,ij->i', x, px)
+            self.xppx[rows] = np.einsum('ij,ij->i', px, px)
+            self.spx[rows] = np.einsum('ij,ij->i', s, px)
+            self.sts[rows] = np.einsum('ij,ij->i', s, s)
+
+    def _points(self, ind: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Return centred and standardised points and gradients for an indexer"""
+        x = (self.sample[ind] - self.offset).astype(self.dtype, copy=False)
+        s = self.gradient[ind].astype(self.dtype, copy=False)
+        if self.scale is not None:
+            x = x / self.scale
+            s = s * self.scale
+        return x, s
+
+    def _combine(self, qf, r, u, sts):
+        """Assemble kernel values from the quadratic forms"""
+        return _imq_combine(qf, r, u, sts, self.trace, self.beta)
+
+    def workspace(self, size: int) -> np.ndarray:
+        copies = 1 if self.gradient.dtype == self.dtype else 2
+        return np.empty((self.WORKSPACE_ROWS + copies * self.d) * size, dtype=self.dtype)
+
+    def diagonal(self, rows: Any = slice(None)) -> np.ndarray:
+        beta = self.beta
+        return -2 * beta * self.trace / (self.c ** (-beta + 1)) + self.sts[rows] / (self.c ** (-beta))
+
+    def column(
+            self,
+            j: int,
+            rows: Any = slice(None),
+            out: Optional[np.ndarray] = None,
+            work: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Evaluate a column of the Stein kernel matrix
+
+        When both `out` and `work` are supplied and `rows` is a slice, no
+        arrays proportional to the number of rows are allocated.
+        """
+        x = self.sample[rows]
+        s = self.gradient[rows]
+        m = x.shape[0]
+        if out is None:
+            out = np.empty(m, dtype=self.dtype)
+        if work is None:
+            work = self.workspace(m)
+        xv = work[:3 * m].reshape(3, m)
+        sv = work[3 * m:5 * m].reshape(2, m)
+        t = work[5 * m:6 * m]
+        xc = work[6 * m:(6 + self.d) * m].reshape(m, self.d)
+        np.subtract(x, self.offset, out=xc)
+        if s.dtype != self.dtype:
+            sc = work[(6 + self.d) * m:(6 + 2 * self.d) * m].reshape(m, self.d)
+            np.copyto(sc, s, casting='same_kind')
+            s = sc
+        beta = self.beta
+
+        # Vectors whose inner products with rows of the sample and gradients
+        # give x'Py, x'PPy, x'Psy, s'Py and s'sy
+        y, sy = self._points(j)
+        py = self.linv.dot(y)
+        vx = np.stack([py, self.linv.dot(py), self.linv.dot(sy)])
+        vs = np.stack([py, sy])
+        if self.scale is not None:
+            vx /= self.scale
+            vs *= self.scale
+        np.dot(vx, xc.T, out=xv)
+        np.dot(vs, s.T, out=sv)
+        qf, r, u = xv
+
+        # Quadratic form x'Px with x replaced by x - y
+        qf *= -2
+        qf += self.xpx[rows]
+        qf += self.xpx[j]
+        np.maximum(qf, 0, out=qf)
+        qf += self.c
+
+        # Quadratic form x'PPx with x replaced by x - y
+        r *= -2
+        r += self.xppx[rows]
+        r += self.xppx[j]
+        np.maximum(r, 0, out=r)
+
+        # Bilinear form (sx - sy)'P(x - y)
+        u += sv[0]
+        np.negative(u, out=u)
+        u += self.spx[rows]
+        u += self.spx[j]
+        u += self.trace
+
+        # Combine the three terms, dividing by increasing powers of qf
+        np.power(qf, -beta, out=t)
+        np.divide(sv[1], t, out=out)
+        t *= qf
+        u /= t
+        u *= -2 * beta
+        out += u
+        t *= qf
+        r /= t
+        r *= -4 * beta * (beta - 1)
+        out += r
+        return out
+
+    def columns(self, cols: np.ndarray, rows: slice = slice(None)) -> np.ndarray:
+        """Evaluate several columns of the Stein kernel matrix together
+
+        As in `column`, the quadratic forms are obtained from products of the
+        sample and gradients with 3 and 2 vectors per column, so b columns cost
+        two matrix products with d x 3b and d x 2b matrices.
+        """
+        x = (self.sample[rows] - self.offset).astype(self.dtype, copy=False)
+        s = self.gradient[rows].astype(self.dtype, copy=False)
+        b = len(cols)
+        y, sy = self._points(cols)
+        py = self.linv.dot(y)
+        vx = np.concatenate([py, self.linv.dot(py), self.linv.dot(sy)])
+        vs = np.concatenate([py, sy])
+        if self.scale is not None:
+            vx /= self.scale
+            vs *= self.scale
+        xv = np.dot(vx, x.T)
+        sv = np.dot(vs, s.T)
+        q = np.maximum(self.xpx[rows] + self.xpx[cols, np.newaxis] - 2 * xv[:b], 0)
+        r = np.maximum(self.xppx[rows] + self.xppx[cols, np.newaxis] - 2 * xv[b:2 * b], 0)
+        u = self.spx[rows] + self.spx[cols, np.newaxis] - xv[2 * b:] - sv[:b]
+        return self._combine(self.c + q, r, u, sv[b:])
+
+    def block(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        x1, s1 = self._points(rows)
+        x2, s2 = self._points(cols)
+        px1 = self.linv.dot(x1)
+        px2 = self.linv.dot(x2)
+        q = np.maximum(self.xpx[rows, np.newaxis] + self.xpx[cols] - 2 * np.dot(x1, px2.T), 0)
+        r = np.maximum(self.xppx[rows, np.newaxis] + self.xppx[cols] - 2 * np.dot(px1, px2.T), 0)
+        u = self.spx[rows, np.newaxis] + self.spx[cols] - np.dot(s1, px2.T) - np.dot(px1, s2.T)
+        return self._combine(self.c + q, r, u, np.dot(s1, s2.T))
+
+    def __call__(self, ind1: Any, ind2: Any) -> np.ndarray:
+        x1, s1 = self._points(ind1)
+        x2, s2 = self._points(ind2)
+        px1 = self.linv.dot(x1)
+        px2 = self.linv.dot(x2)
+        def dot(a, b):
+            return np.sum(a * b, axis=-1)
+        q = np.maximum(self.xpx[ind1] + self.xpx[ind2] - 2 * dot(x1, px2), 0)
+        r = np.maximum(self.xppx[ind1] + self.xppx[ind2] - 2 * dot(px1, px2), 0)
+        u = self.spx[ind1] + self.spx[ind2] - dot(s1, px2) - dot(px1, s2)
+        return self._combine(self.c + q, r, u, dot(s1, s2))
+
+    def subset(self, indices: np.ndarray) -> 'ImqKernelPlan':
+        # Per-point quantities are taken over rather than recomputed
+        plan = copy.copy(self)
+        for key in ['sample', 'gradient', 'xpx', 'xppx', 'spx', 'sts']:
+            setattr(plan, key, getattr(self, key)[indices])
+        plan.n = len(indices)
+        return plan
+
+
+class ImqBatchKernelPlan:
+    """Stein kernel based on inverse multiquadratic kernel, prepared for a stack of samples
+
+    The B samples of n points each have their own preconditioners and
+    standardisation. Columns for one point of each sample are evaluated
+    together with batched matrix products, so a step of B greedy searches
+    run in lockstep is a single kernel evaluation. A centred copy of the
+    samples is held, as in `ImqKernelPlan`.
+
+    Parameters
+    ----------
+    sample: np.ndarray
+        B x n x d array of B samples of n points.
+    gradient: np.ndarray
+        B x n x d array of gradients of the log target at the points in `sample`.
+    linv: np.ndarray
+        B x d x d array of preconditioner matrices.
+    c: float
+        parameter of the inverse multiquadratic kernel. Default: 1.0.
+    beta: float
+        exponent of the inverse multiquadratic kernel. Default: -0.5.
+    scale: Optional[np.ndarray]
+        if provided, B x d array such that the kernel is evaluated for the points
+        `sample / scale[:, np.newaxis]` with gradients `gradient * scale[:, np.newaxis]`.
+    """
+
+    def __init__(
+            self,
+            sample: np.ndarray,
+            gradient: np.ndarray,
+            linv: np.ndarray,
+            c: float = 1.0,
+            beta: float = -0.5,
+            scale: Optional[np.ndarray] = None,
+    ):
+        plans = [
+            ImqKernelPlan(sample[b], gradient[b], linv[b], c=c, beta=beta, scale=None if scale is None else scale[b])
+            for b in range(sample.shape[0])
+        ]
+        self.sample = sample - np.stack([plan.offset for plan in plans])[:, np.newaxis, :]
+        self.gradient = gradient
+        self.dtype = plans[0].dtype
+        self.linv = np.asarray(linv, dtype=self.dtype)
+        self.c = c
+        self.beta = beta
+        self.scale = None if scale is None else np.asarray(scale, dtype=self.dtype)[:, np.newaxis, :]
+        self.trace = np.array([plan.trace for plan in plans])[:, np.newaxis]
+        self.xpx = np.stack([plan.xpx for plan in plans])
+        self.xppx = np.stack([plan.xppx for plan in plans])
+        self.spx = np.stack([plan.spx for plan in plans])
+        self._diagonal = np.stack([plan.diagonal() for plan in plans])
+
+    def diagonal(self) -> np.ndarray:
+        """Evaluate the diagonals of the Stein kernel matrices
+
+        Returns
+        -------
+        np.ndarray
+            B x n array containing the diagonal of each Stein kernel matrix.
+        """
+        return self._diagonal
+
+    def column(self, j: np.ndarray) -> np.ndarray:
+        """Evaluate one column of each Stein kernel matrix
+
+        Parameters
+        ----------
+        j: np.ndarray
+            array of length B with the index of a point in each sample.
+
+        Returns
+        -------
+        np.ndarray
+            B x n array of values of the Stein kernel between all points in
+            each sample and the selected point in that sample.
+        """
+        b = np.arange(self.sample.shape[0])
+        y = self.sample[b, j][:, np.newaxis, :]
+        sy = self.gradient[b, j][:, np.newaxis, :]
+        if self.scale is not None:
+            y = y / self.scale
+            sy = sy * self.scale
+        py = np.matmul(y, self.linv)
+        vx = np.concatenate([py, np.matmul(py, self.linv), np.matmul(sy, self.linv)], axis=1)
+        vs = np.concatenate([py, sy], axis=1)
+        if self.scale is not None:
+            vx /= self.scale
+            vs *= self.scale
+        xv = np.matmul(vx, self.sample.transpose(0, 2, 1))
+        sv = np.matmul(vs, self.gradient.transpose(0, 2, 1))
+        q = np.maximum(self.xpx + self.xpx[b, j][:, np.newaxis] - 2 * xv[:, 0], 0)
+        r = np.maximum(self.xppx + self.xppx[b, j][:, np.newaxis] - 2 * xv[:, 1], 0)
+        u = self.spx + self.spx[b, j][:, np.newaxis] - xv[:, 2] - sv[:, 0]
+        return _imq_combine(self.c + q, r, u, sv[:, 1], self.trace, self.beta)
+
+
+def make_imq_plan(
+        sample: np.ndarray,
+        gradient: np.ndarray,
+        preconditioner: str = 'id',
+        c: float = 1.0,
+        beta: float = -0.5,
+        scale: Optional[np.ndarray] = None,
+        dtype: Any = None,
+) -> ImqKernelPlan:
+    """Create a Stein kernel plan based on inverse multiquadratic kernel
+
+    Parameters
+    ----------
+    sample: np.ndarray
+        n x d array where each row is a sample point.
+    gradient: np.ndarray
+        n x d array where each row is a gradient of the log target.
+    preconditioner: str
+        optional string specifying the preconditioner to be used, as in
+        `make_precon`. The structured form of the preconditioner is used.
+    c: float
+        parameter of the inverse multiquadratic kernel. Default: 1.0.
+    beta: float
+        exponent of the inverse multiquadratic kernel. Default: -0.5.
+    scale: Optional[np.ndarray]
+        if provided, the kernel is evaluated for the points `sample / scale`
+        with gradients `gradient * scale`.
+    dtype: Any
+        floating-point type used to evaluate the kernel. By default, the type
+        of the arrays is used.
+
+    Returns
+    -------
+    ImqKernelPlan
+        kernel plan for the sample.
+    """
+    linv = make_precon(sample, preconditioner, scale=scale, structured=True)
+    return ImqKernelPlan(sample, gradient, linv, c=c, beta=beta, scale=scale, dtype=dtype)
+
+
+class NystromKernelPlan(KernelPlan):
+    """Low-rank approximation of a Stein kernel based on landmark points
+
+    The Stein kernel matrix K is approximated by C W^+ C', where C contains
+    the columns of K for `rank` landmark points spread evenly over the sample
+    and W is the corresponding square block. The approximation is stored as
+    an n x r factor F with K ~ F F', so that a column costs O(n r) operations
+    instead of a pass over the sample. The diagonal is evaluated exactly.
+
+    Parameters
+    ----------
+    plan: KernelPlan
+        kernel plan to approximate.
+    rank: int
+        number of landmark points.
+    """
+
+    def __init__(self, plan: KernelPlan, rank: int):
+        assert 0 < rank <= plan.n, 'rank must be between 1 and the sample size.'
+        self.plan = plan
+        self.n = plan.n
+        self.dtype = plan.dtype
+        self.landmarks = np.unique(np.linspace(0, self.n - 1, rank, dtype=int))
+
+        # Columns of the kernel matrix for the landmark points
+        c = np.empty((self.n, len(self.landmarks)), dtype=self.dtype)
+        for rows in _row_blocks(self.n, max(1, CHUNK_ELEMENTS // len(self.landmarks))):
+            c[rows] = plan.block(np.arange(rows.start, rows.stop), self.landmarks)
+
+        # Factor of the pseudo-inverse of the landmark block, dropping directions
+        # with negligible eigenvalues
+        eigval, eigvec = eigh(c[self.landmarks].astype(np.float64))
+        keep = eigval > eigval[-1] * len(eigval) * np.finfo(np.float64).eps
+        self.factor = np.dot(c, eigvec[:, keep] / np.sqrt(eigval[keep])).astype(self.dtype)
+        self._diagonal = plan.diagonal()
+
+    def __call__(self, ind1: Any, ind2: Any) -> np.ndarray:
+        return np.sum(self.factor[ind1] * self.factor[ind2], axis=-1)
+
+    def diagonal(self, rows: Any = slice(None)) -> np.ndarray:
+        return self._diagonal[rows]
+
+    def column(
+            self,
+            j: int,
+            rows: Any = slice(None),
+            out: Optional[np.ndarray] = None,
+            work: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        if out is None:
+            return np.dot(self.factor[rows], self.factor[j])
+        return np.dot(self.factor[rows], self.factor[j], out=out)
+
+    def block(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        return np.dot(self.factor[rows], self.factor[cols].T)
+
+    def columns(self, cols: np.ndarray, rows: slice = slice(None)) -> np.ndarray:
+        return np.dot(self.factor[cols], self.factor[rows].T)
+
+
+class WendlandKernelPlan(KernelPlan):
+    """Stein kernel based on Wendland kernel with a spatial index over the sample
+
+    The Stein kernel of `vfk0_wendland` vanishes for points further than 1
+    apart in the metric of the preconditioner. A KD-tree is built over the
+    sample transformed by a Cholesky factor of the preconditioner, so that
+    the nonzero elements of a kernel column are found and evaluated without
+    a pass over the whole sample (see `sparse_column`).
+
+    The standardised sample and gradients are held in memory, as the tree
+    requires a copy of the sample anyway.
+
+    Parameters
+    ----------
+    sample: np.ndarray
+        n x d array where each row is a sample point.
+    gradient: np.ndarray
+        n x d array where each row is a gradient of the log target.
+    linv: np.ndarray | Preconditioner
+        d x d preconditioner matrix, or a structured preconditioner.
+    ell: Optional[int]
+        exponent parameter of the Wendland function. Default: d // 2 + 2.
+    scale: Optional[np.ndarray]
+        if provided, the kernel is evaluated for the points `sample / scale`
+        with gradients `gradient * scale`.
+    """
+
+    def __init__(
+            self,
+            sample: np.ndarray,
+            gradient: np.ndarray,
+            linv: np.ndarray | Preconditioner,
+            ell: Optional[int] = None,
+            scale: Optional[np.ndarray] = None,
+    ):
+        self.dtype = np.result_type(sample.dtype, gradient.dtype, np.float32)
+        self.sample = np.array(sample, dtype=self.dtype)
+        self.gradient = np.array(gradient, dtype=self.dtype)
+        if scale is not None:
+            self.sample /= scale
+            self.gradient *= scale
+        self.n, d = sample.shape
+        self.linv = as_preconditioner(linv).astype(self.dtype)
+        self.ell = ell
+        a = _wendland_exponent(d, ell)
+        self.tree = cKDTree(as_preconditioner(linv).sqrt_dot(self.sample))
+        self._diagonal = a * (a + 1) * self.linv.trace() + np.sum(self.gradient ** 2, axis=1)
+
+    def __call__(self, ind1: Any, ind2: Any) -> np.ndarray:
+        return vfk0_wendland(
+            self.sample[ind1], self.sample[ind2], self.gradient[ind1], self.gradient[ind2], self.linv, ell=self.ell,
+        )
+
+    def diagonal(self, rows: Any = slice(None)) -> np.ndarray:
+        return self._diagonal[rows]
+
+    def neighbours(self, j: int) -> np.ndarray:
+        """Return the sorted indices of the points within the support of the kernel around point `j`"""
+        return np.sort(np.asarray(self.tree.query_ball_point(self.tree.data[j], r=1.0), dtype=np.intp))
+
+    def sparse_column(self, j: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Evaluate the nonzero elements of a column of the Stein kernel matrix
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            indices of the rows within the support of the kernel around point
+            `j` and the values of the Stein kernel for these rows.
+        """
+        rows = self.neighbours(j)
+        return rows, self(rows, [j])
+
+    def subset(self, indices: np.ndarray) -> 'WendlandKernelPlan':
+        return WendlandKernelPlan(self.sample[indices], self.gradient[indices], self.linv, ell=self.ell)
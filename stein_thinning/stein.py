@@ -1,18 +1,35 @@
 """Kernel matrix functions"""
 
-from typing import Any, Callable
+from typing import Any, Callable, Optional, Sequence, Tuple
 
 import numpy as np
+from stein_thinning.kernel import KernelPlan
 
 
 IndexerT = Any
 
 
-def kmat(integrand: Callable[[IndexerT, IndexerT], np.ndarray], n: int) -> np.ndarray:
+def _tile(integrand: Callable[[IndexerT, IndexerT], np.ndarray], rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Evaluate the integrand for all pairs of the given row and column indices"""
+    if isinstance(integrand, KernelPlan):
+        return integrand.block(rows, cols)
+    ind1, ind2 = np.meshgrid(rows, cols, indexing='ij')
+    return np.reshape(integrand(ind1.ravel(), ind2.ravel()), ind1.shape)
+
+
+def kmat(
+        integrand: Callable[[IndexerT, IndexerT], np.ndarray],
+        n: int,
+        block_size: int = 256,
+        out: Optional[np.ndarray] = None,
+        dtype: Any = np.float64,
+) -> np.ndarray:
     """Compute a Stein kernel matrix
 
     The matrix is obtained by evaluating the provided Stein kernel
-    on a Cartesian square of `sample`.
+    on a Cartesian square of `sample`. The lower triangle is evaluated in
+    square tiles of `block_size` x `block_size` elements, each written to
+    the output together with its transpose.
 
     Parameters
     ----------
@@ -21,25 +38,45 @@ def kmat(integrand: Callable[[IndexerT, IndexerT], np.ndarray], n: int) -> np.nd
         integral for the given indices (rows and columns).
     n: int
         size of the matrix to return
+    block_size: int
+        number of rows and columns in a tile. Default: 256.
+    out: Optional[np.ndarray]
+        n x n array to write the result to. This can be a memory-mapped array,
+        e.g. created with `np.lib.format.open_memmap`, for matrices that do not
+        fit in memory.
+    dtype: Any
+        data type of the matrix if `out` is not provided. Default: np.float64.
 
     Returns
     -------
     np.ndarray
         n x n array containing the Stein kernel matrix.
     """
-    k0 = np.zeros((n, n))
-    ind1, ind2 = np.triu_indices(n)
-    v = integrand(ind1, ind2).squeeze()
-    k0[ind1, ind2] = v
-    k0[ind2, ind1] = v
-    return k0
+    assert block_size > 0, 'block_size must be positive.'
+    if out is None:
+        out = np.empty((n, n), dtype=dtype)
+    assert out.shape == (n, n), f'out must have shape {(n, n)}.'
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        for col_start in range(0, start + 1, block_size):
+            col_stop = min(col_start + block_size, n)
+            tile = _tile(integrand, np.arange(start, stop), np.arange(col_start, col_stop))
+            out[start:stop, col_start:col_stop] = tile
+            out[col_start:col_stop, start:stop] = tile.T
+    return out
 
 
-def ksd(integrand: Callable[[IndexerT, IndexerT], np.ndarray], n: int) -> np.ndarray:
+def ksd(
+        integrand: Callable[[IndexerT, IndexerT], np.ndarray],
+        n: int,
+        block_size: int = 256,
+        checkpoints: Optional[Sequence[int]] = None,
+) -> np.ndarray:
     """Compute a cumulative sequence of KSD values.
 
     KSD values are calculated from sums of elements in each i x i square in the top-left
-    corner of the kernel Stein matrix.
+    corner of the kernel Stein matrix. The lower triangle of the matrix is evaluated in
+    square tiles of `block_size` x `block_size` elements.
 
     Parameters
     ----------
@@ -48,16 +85,195 @@ def ksd(integrand: Callable[[IndexerT, IndexerT], np.ndarray], n: int) -> np.nda
         integral for the given indices (rows and columns).
     n: int
         number of terms to calculate
+    block_size: int
+        number of rows and columns in a tile. Default: 256.
+    checkpoints: Optional[Sequence[int]]
+        if provided, only the elements of the sequence with these indices are
+        returned, e.g. `np.geomspace(1, n, 50).astype(int) - 1` for log-spaced
+        values. Terms beyond the largest index are not computed.
 
     Returns
     -------
     np.ndarray
-        array shaped (n,) containing the sequence of KSD values.
+        array shaped (n,) containing the sequence of KSD values, or the values
+        at `checkpoints` if provided.
     """
     assert n > 0
-    cum_sum = np.zeros(n)
-    cum_sum[0] = integrand(0, 0)
-    for i in range(1, n):
-        vals = integrand([i], slice(0, i + 1))
-        cum_sum[i] = cum_sum[i - 1] + 2 * np.sum(vals) - vals[-1]
-    return np.sqrt(cum_sum) / np.arange(1, n + 1)
+    assert block_size > 0, 'block_size must be positive.'
+    if checkpoints is not None:
+        checkpoints = np.asarray(checkpoints, dtype=int)
+        assert np.all((checkpoints >= 0) & (checkpoints < n)), 'checkpoints must be between 0 and n - 1.'
+        n = int(np.max(checkpoints)) + 1 if checkpoints.size > 0 else 0
+
+    # Sum of each row of the lower triangle, counting off-diagonal elements twice,
+    # accumulated in double precision whatever the precision of the integrand
+    row_sums = np.zeros(n)
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        for col_start in range(0, start, block_size):
+            cols = np.arange(col_start, col_start + block_size)
+            row_sums[rows] += 2 * np.sum(_tile(integrand, rows, cols), axis=1, dtype=np.float64)
+        tile = _tile(integrand, rows, rows)
+        row_sums[rows] += 2 * np.sum(np.tril(tile, -1), axis=1, dtype=np.float64) + np.diag(tile)
+
+    cum_sum = np.cumsum(row_sums)
+    result = np.sqrt(cum_sum) / np.arange(1, n + 1)
+    return result if checkpoints is None else result[checkpoints]
+
+
+def _matvec(
+        integrand: Callable[[IndexerT, IndexerT], np.ndarray] | np.ndarray,
+        w: np.ndarray,
+        block_size: int = 256,
+) -> np.ndarray:
+    """Multiply the kernel Stein matrix by a vector, evaluating it in tiles
+
+    A precomputed matrix, possibly memory-mapped, is read in blocks of rows.
+    Otherwise the lower triangle is evaluated in square tiles, each of which
+    contributes to two blocks of the product.
+    """
+    n = w.shape[0]
+    out = np.zeros(n)
+    if isinstance(integrand, np.ndarray):
+        for start in range(0, n, block_size):
+            rows = slice(start, min(start + block_size, n))
+            out[rows] = np.dot(np.asarray(integrand[rows], dtype=np.float64), w)
+        return out
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        for col_start in range(0, start, block_size):
+            cols = np.arange(col_start, col_start + block_size)
+            tile = _tile(integrand, rows, cols).astype(np.float64, copy=False)
+            out[rows] += np.dot(tile, w[cols])
+            out[cols] += np.dot(w[rows], tile)
+        out[rows] += np.dot(_tile(integrand, rows, rows).astype(np.float64, copy=False), w[rows])
+    return out
+
+
+def _kernel_diagonal(integrand: Callable[[IndexerT, IndexerT], np.ndarray] | np.ndarray, n: int) -> np.ndarray:
+    """Diagonal of the kernel Stein matrix in double precision"""
+    if isinstance(integrand, np.ndarray):
+        return np.diagonal(integrand).astype(np.float64)
+    if isinstance(integrand, KernelPlan):
+        return integrand.diagonal().astype(np.float64)
+    ind = np.arange(n)
+    return np.asarray(integrand(ind, ind), dtype=np.float64)
+
+
+def _kernel_column(integrand: Callable[[IndexerT, IndexerT], np.ndarray] | np.ndarray, j: int, n: int) -> np.ndarray:
+    """Column of the kernel Stein matrix in double precision"""
+    if isinstance(integrand, np.ndarray):
+        return np.asarray(integrand[:, j], dtype=np.float64)
+    if isinstance(integrand, KernelPlan):
+        return integrand.column(j).astype(np.float64)
+    return np.asarray(integrand(np.arange(n), np.full(n, j)), dtype=np.float64)
+
+
+def weighted_ksd(
+        integrand: Callable[[IndexerT, IndexerT], np.ndarray],
+        weights: np.ndarray,
+        block_size: int = 256,
+) -> float:
+    """Compute the KSD of a weighted set of points
+
+    The KSD is sqrt(w'Kw) for the Stein kernel matrix K of the points and the
+    weights w normalised to sum to 1. With the multiplicities of distinct
+    points as weights, this is the KSD of the sample they were taken from.
+    The lower triangle of the matrix is evaluated in square tiles of
+    `block_size` x `block_size` elements and never stored.
+
+    Parameters
+    ----------
+    integrand: Callable[[IndexerT, IndexerT], np.ndarray]
+        vectorised function returning the values of the integrand in the KSD
+        integral for the given indices (rows and columns).
+    weights: np.ndarray
+        array shaped (n,) of non-negative weights of the points.
+    block_size: int
+        number of rows and columns in a tile. Default: 256.
+
+    Returns
+    -------
+    float
+        KSD of the weighted points.
+    """
+    assert block_size > 0, 'block_size must be positive.'
+    weights = np.asarray(weights, dtype=np.float64)
+    assert weights.ndim == 1 and np.all(weights >= 0) and np.sum(weights) > 0, 'weights must be non-negative and not all zero.'
+    w = weights / np.sum(weights)
+    return np.sqrt(max(np.dot(w, _matvec(integrand, w, block_size)), 0.))
+
+
+def optimal_weights(
+        integrand: Callable[[IndexerT, IndexerT], np.ndarray] | np.ndarray,
+        n: int,
+        weights: Optional[np.ndarray] = None,
+        max_iter: int = 1000,
+        tol: float = 1e-6,
+        block_size: int = 256,
+) -> Tuple[np.ndarray, float]:
+    """Find the weights on the simplex that minimise the KSD of a set of points
+
+    The quadratic form w'Kw is minimised over the probability simplex by the
+    pairwise Frank-Wolfe algorithm: each iteration moves weight from the
+    point of the support with the largest gradient to the point with the
+    smallest, with exact line search. Only the product Kw for the starting
+    weights is computed in tiles of the matrix; it is then updated from two
+    columns of K per iteration, so the matrix is never stored. Iterations stop
+    when the duality gap, which bounds the distance of w'Kw from its minimum,
+    falls below `tol` times w'Kw.
+
+    Parameters
+    ----------
+    integrand: Callable[[IndexerT, IndexerT], np.ndarray] | np.ndarray
+        vectorised function returning the values of the integrand in the KSD
+        integral for the given indices (rows and columns), or the n x n kernel
+        Stein matrix, e.g. a memory-mapped array filled by `kmat`.
+    n: int
+        number of points.
+    weights: Optional[np.ndarray]
+        array shaped (n,) of non-negative starting weights, e.g. the number of
+        times each point was selected by greedy thinning. Default: equal weights.
+    max_iter: int
+        maximum number of iterations. Default: 1000.
+    tol: float
+        relative duality gap at which to stop. Default: 1e-6.
+    block_size: int
+        number of rows and columns in a tile. Default: 256.
+
+    Returns
+    -------
+    Tuple[np.ndarray, float]
+        array shaped (n,) of weights summing to 1, and the KSD of the points
+        with these weights.
+    """
+    assert n > 0
+    assert block_size > 0, 'block_size must be positive.'
+    if weights is None:
+        weights = np.ones(n)
+    weights = np.asarray(weights, dtype=np.float64)
+    assert weights.shape == (n,), 'weights must have one element per point.'
+    assert np.all(weights >= 0) and np.sum(weights) > 0, 'weights must be non-negative and not all zero.'
+    w = weights / np.sum(weights)
+
+    kw = _matvec(integrand, w, block_size)
+    diag = _kernel_diagonal(integrand, n)
+    for _ in range(max_iter):
+        value = np.dot(w, kw)
+        s = np.argmin(kw)
+        if 2 * (value - kw[s]) <= tol * abs(value):
+            break
+        support = np.flatnonzero(w > 0)
+        v = support[np.argmax(kw[support])]
+        if v == s:
+            break
+        ks = _kernel_column(integrand, s, n)
+        kv = _kernel_column(integrand, v, n)
+        # Minimise the quadratic along e_s - e_v, keeping w[v] non-negative
+        slope = kw[s] - kw[v]
+        curvature = diag[s] + diag[v] - 2 * ks[v]
+        step = w[v] if curvature <= 0 else min(-slope / curvature, w[v])
+        w[s] += step
+        w[v] -= step
+        kw += step * (ks - kv)
+    return w, np.sqrt(max(np.dot(w, kw), 0.))
@@ -1,11 +1,37 @@
 """Implementation of Stein thinning"""
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+import copy
+from functools import partial
+import heapq
+from itertools import repeat
 import logging
-from typing import Any, Callable, Optional, Tuple
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import time
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 import warnings
 
 import numpy as np
-from stein_thinning.kernel import make_imq
+from stein_thinning.kernel import (
+    CHUNK_ELEMENTS,
+    DiagonalPreconditioner,
+    ImqBatchKernelPlan,
+    ImqKernelPlan,
+    KernelPlan,
+    NystromKernelPlan,
+    PRECONDITIONER_TYPES,
+    PairwiseKernelPlan,
+    WendlandKernelPlan,
+    _cholesky_precision,
+    _row_blocks,
+    make_imq_plan,
+    make_precon,
+)
+from stein_thinning.stein import optimal_weights
 
 
 logger = logging.getLogger(__name__)
@@ -14,100 +40,856 @@ logger = logging.getLogger(__name__)
 IndexerT = Any
 
 
+class ColumnCache:
+    """Least recently used cache of Stein kernel columns
+
+    The greedy search can select the same point several times, in which case
+    the same kernel column is added to the running sums again. A cache passed
+    to `thin` or `thin_gf` stores the columns of selected points, keyed by
+    their index, evicting the least recently used columns when the total size
+    exceeds `max_bytes`. Counts of cache hits and misses are kept in the
+    `hits` and `misses` attributes.
+
+    Since columns are identified by index only, a cache must not be shared
+    between thinning runs with different samples or settings.
+
+    Parameters
+    ----------
+    max_bytes: int
+        maximum total size of the cached columns in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        assert max_bytes >= 0, 'max_bytes must be non-negative.'
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._columns = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def accepts(self, nbytes: int) -> bool:
+        """Check if a column of `nbytes` bytes fits in the cache"""
+        return nbytes <= self.max_bytes
+
+    def get(self, j: int) -> Optional[np.ndarray]:
+        """Return the cached column for point `j` or None if it is not cached"""
+        column = self._columns.get(j)
+        if column is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._columns.move_to_end(j)
+        return column
+
+    def put(self, j: int, column: np.ndarray):
+        """Store the column for point `j`, evicting least recently used columns as needed"""
+        if not self.accepts(column.nbytes):
+            return
+        if j in self._columns:
+            self.nbytes -= self._columns.pop(j).nbytes
+        while self.nbytes + column.nbytes > self.max_bytes:
+            self.nbytes -= self._columns.popitem(last=False)[1].nbytes
+        self._columns[j] = column
+        self.nbytes += column.nbytes
+
+
+class ThinningProgress(NamedTuple):
+    """State of a greedy search passed to a progress callback"""
+    step: int
+    """number of points selected so far"""
+    n_points: int
+    """total number of points to select"""
+    index: int
+    """index of the last selected point in the sample"""
+    objective: float
+    """running sum of the last selected point, i.e. the increase of the squared KSD times the number of points squared"""
+    ksd: float
+    """KSD of the points selected so far"""
+    elapsed: float
+    """wall time since the start of the search, in seconds"""
+    kernel_time: float
+    """time spent evaluating the kernel, summed over workers, in seconds"""
+    search_time: float
+    """time spent updating the running sums and searching for the minimum, summed over workers, in seconds"""
+
+
+class _KsdTrace:
+    """KSD of the selected points, updated at no kernel cost during a greedy search
+
+    When a point is selected, its running sum is the sum of its diagonal
+    element and twice its kernel values with the previously selected points.
+    Adding it to the sum of the kernel matrix of the previous points gives
+    the sum for the extended selection, whose square root divided by the
+    number of points is the KSD.
+
+    Parameters
+    ----------
+    target_ksd: Optional[float]
+        if provided, the search stops when the KSD is at most this value.
+    rtol: Optional[float]
+        if provided, the search stops at the first point that does not reduce the
+        smallest KSD so far by at least this fraction. That point is rejected:
+        it is not recorded, and `rejected` is set.
+    """
+
+    def __init__(self, target_ksd: Optional[float] = None, rtol: Optional[float] = None):
+        assert target_ksd is None or target_ksd > 0, 'target_ksd must be positive.'
+        assert rtol is None or 0 <= rtol < 1, 'rtol must be between 0 and 1.'
+        self.target_ksd = target_ksd
+        self.rtol = rtol
+        self.total = 0.
+        self.best = np.inf
+        self.values = []
+        self.rejected = False
+
+    def add(self, objective: float) -> bool:
+        """Record the running sum of a selected point and return True if the search should stop"""
+        total = self.total + objective
+        value = np.sqrt(max(total, 0.)) / (len(self.values) + 1)
+        self.rejected = self.rtol is not None and value > (1 - self.rtol) * self.best
+        if self.rejected:
+            return True
+        self.total = total
+        self.values.append(value)
+        self.best = min(self.best, value)
+        return self.target_ksd is not None and value <= self.target_ksd
+
+
+class ThinningProfile:
+    """Aggregated measurements of a greedy search
+
+    A profile passed to `thin` or `thin_gf` is filled in when the search
+    finishes. Times spent by workers are summed, so with several workers they
+    can exceed the wall time.
+
+    Attributes
+    ----------
+    steps: int
+        number of points selected.
+    columns: int
+        number of kernel columns evaluated, excluding columns read from a cache.
+    cached_columns: int
+        number of kernel columns read from a cache.
+    wall_time: float
+        wall time of the search, in seconds.
+    kernel_time: float
+        time spent evaluating the diagonal and columns of the kernel matrix, in seconds.
+    search_time: float
+        time spent updating the running sums and searching for minima, in seconds.
+    bytes_allocated: int
+        size of the arrays allocated by the search: running sums, scratch
+        buffers and columns stored in a cache.
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.columns = 0
+        self.cached_columns = 0
+        self.wall_time = 0.
+        self.kernel_time = 0.
+        self.search_time = 0.
+        self.bytes_allocated = 0
+
+    def __repr__(self):
+        return (
+            f'ThinningProfile(steps={self.steps}, columns={self.columns}, cached_columns={self.cached_columns}, '
+            f'wall_time={self.wall_time:.3f}, kernel_time={self.kernel_time:.3f}, '
+            f'search_time={self.search_time:.3f}, bytes_allocated={self.bytes_allocated})'
+        )
+
+
+def _update_shard(
+        integrand: KernelPlan,
+        k0: np.ndarray,
+        shard: List[slice],
+        buffer: Tuple[np.ndarray, Optional[np.ndarray]],
+        j: Optional[int],
+        cached: Optional[np.ndarray] = None,
+        target: Optional[np.ndarray] = None,
+) -> Tuple[int, float, float, float]:
+    """Add a kernel column to the running sums in a shard of row blocks
+
+    The column for point `j` is read from `cached` if provided, otherwise it is
+    evaluated and, if `target` is provided, also stored there. If `j` is None,
+    the running sums are initialised with the diagonal of the kernel matrix.
+
+    Returns
+    -------
+    Tuple[int, float, float, float]
+        index and value of the first minimum of the running sums in the shard,
+        followed by the time spent evaluating the kernel and the time spent
+        updating the running sums and searching for the minimum
+    """
+    col, work = buffer
+    best = None
+    kernel_time = search_time = 0.
+    for rows in shard:
+        start = time.perf_counter()
+        if j is None:
+            k0[rows] = integrand.diagonal(rows)
+            kernel_time += time.perf_counter() - start
+        else:
+            vals = col[:rows.stop - rows.start]
+            if cached is not None:
+                np.multiply(cached[rows], 2, out=vals)
+            elif target is not None:
+                np.multiply(integrand.column(j, rows, out=target[rows], work=work), 2, out=vals)
+            else:
+                integrand.column(j, rows, out=vals, work=work)
+                vals *= 2
+            kernel_time += time.perf_counter() - start
+            start = time.perf_counter()
+            k0[rows] += vals
+        k = rows.start + np.argmin(k0[rows])
+        if best is None or k0[k] < k0[best]:
+            best = k
+        search_time += time.perf_counter() - start
+    return best, k0[best], kernel_time, search_time
+
+
+class _SharedArray(NamedTuple):
+    """Description of an array in shared memory"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class _SharedPlan(NamedTuple):
+    """Kernel plan with its arrays replaced by descriptions of shared memory"""
+    cls: type
+    state: dict
+
+
+def _share_array(arr: np.ndarray, stack: ExitStack, copy: bool = True) -> _SharedArray:
+    """Create a shared memory block holding a copy of an array
+
+    The block is released when `stack` is closed.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    stack.callback(shm.unlink)
+    stack.callback(shm.close)
+    if copy:
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+        for rows in _row_blocks(arr.shape[0], max(1, CHUNK_ELEMENTS // max(1, arr[:1].size))):
+            view[rows] = arr[rows]
+        del view
+    return _SharedArray(shm.name, arr.shape, arr.dtype.str)
+
+
+def _share_plan(plan: KernelPlan, stack: ExitStack) -> _SharedPlan:
+    """Copy the arrays held by a kernel plan, including nested plans, to shared memory"""
+    state = {}
+    for key, value in vars(plan).items():
+        if isinstance(value, np.ndarray) and value.ndim > 0:
+            value = _share_array(value, stack)
+        elif isinstance(value, KernelPlan):
+            value = _share_plan(value, stack)
+        state[key] = value
+    return _SharedPlan(type(plan), state)
+
+
+def _attach_array(spec: _SharedArray, handles: list) -> np.ndarray:
+    """Create an array backed by an existing shared memory block"""
+    shm = shared_memory.SharedMemory(name=spec.name)
+    handles.append(shm)
+    return np.ndarray(spec.shape, dtype=np.dtype(spec.dtype), buffer=shm.buf)
+
+
+def _attach_plan(spec: _SharedPlan, handles: list) -> KernelPlan:
+    """Reconstruct a kernel plan shared with `_share_plan`"""
+    plan = object.__new__(spec.cls)
+    for key, value in spec.state.items():
+        if isinstance(value, _SharedArray):
+            value = _attach_array(value, handles)
+        elif isinstance(value, _SharedPlan):
+            value = _attach_plan(value, handles)
+        setattr(plan, key, value)
+    return plan
+
+
+# State of a worker process in the process backend
+_worker = {}
+
+
+def _init_worker(plan: _SharedPlan, k0: _SharedArray, shards: List[List[slice]], size: int):
+    _worker['handles'] = []
+    _worker['integrand'] = _attach_plan(plan, _worker['handles'])
+    _worker['k0'] = _attach_array(k0, _worker['handles'])
+    _worker['shards'] = shards
+    integrand = _worker['integrand']
+    _worker['buffer'] = (np.empty(size, dtype=integrand.dtype), integrand.workspace(size))
+
+
+def _worker_update(shard: int, j: Optional[int]) -> Tuple[int, float, float, float]:
+    return _update_shard(_worker['integrand'], _worker['k0'], _worker['shards'][shard], _worker['buffer'], j)
+
+
+# Largest number of rows of a block in the default partitioning, so that a
+# sample is split into enough blocks to keep all workers busy
+MAX_BLOCK_ROWS = 8192
+
+
+def _default_block_size(integrand: KernelPlan, points: int = 1) -> int:
+    """Number of rows of a block used when no block size is given
+
+    The block size only depends on the plan and the number of columns
+    evaluated together, `points`, not on the number of workers, so that the
+    blocks, and hence the results, are the same for any `n_jobs`. The
+    temporary arrays of `points` columns are bounded by `points` times those
+    of a single column.
+    """
+    work = integrand.workspace(1)
+    row_elements = points * (1 + (0 if work is None else work.size))
+    return max(1, min(MAX_BLOCK_ROWS, CHUNK_ELEMENTS // row_elements))
+
+
 def _greedy_search(
         n_points: int,
-        integrand: Callable[[IndexerT, IndexerT], np.ndarray],
-) -> np.ndarray | Tuple[np.ndarray, np.ndarray]:
+        integrand: KernelPlan,
+        block_size: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        cache: Optional[ColumnCache] = None,
+        backend: str = 'thread',
+        running_sums: Optional[np.ndarray] = None,
+        last: Optional[int] = None,
+        resume: bool = False,
+        callback: Optional[Callable[[ThinningProgress], None]] = None,
+        callback_interval: int = 1,
+        profile: Optional[ThinningProfile] = None,
+        trace: Optional[_KsdTrace] = None,
+        rows: Optional[np.ndarray] = None,
+) -> np.ndarray:
     """Select points minimising total kernel Stein distance
 
+    Kernel columns are evaluated in blocks of rows into scratch buffers that
+    are allocated once and reused in every iteration, so the memory used on
+    top of the running sums is proportional to `block_size`.
+
+    With `n_jobs > 1`, contiguous groups of blocks (shards) are processed by
+    a pool of workers, each updating its part of the running sums and finding
+    its local minimum. Local minima are combined in row order, and the blocks
+    do not depend on the number of workers, so the selection is identical to
+    the serial one.
+
+    With the 'process' backend, the arrays held by the kernel plan and the
+    running sums are placed in shared memory, and each step only sends the
+    index of the selected point to the worker processes and receives the
+    minimum of each shard.
+
     Parameters
     ----------
     n_points: int
         number of points to select.
-    integrand: Callable[[IndexerT, IndexerT], np.ndarray]
-        function returning values of the integrand in the KSD integral
+    integrand: KernelPlan
+        kernel plan returning values of the integrand in the KSD integral
         for points identified by two indices (row and column).
+    block_size: Optional[int]
+        number of rows of a kernel column evaluated at once. By default, blocks
+        hold at most `CHUNK_ELEMENTS` elements of column and workspace, and at
+        most `MAX_BLOCK_ROWS` rows.
+    n_jobs: Optional[int]
+        number of workers to use. Default: 1.
+    cache: Optional[ColumnCache]
+        if provided, kernel columns are stored in the cache and reused when
+        the same point is selected again. Only supported by the 'thread' backend.
+    backend: str
+        either 'thread' (default) or 'process', specifying whether the workers
+        are threads or processes.
+    running_sums: Optional[np.ndarray]
+        if provided, array of n double-precision values holding the running
+        sums of the search, which is updated in place. This allows a search to
+        be continued by another call.
+    last: Optional[int]
+        if provided, the search continues a previous one with the given
+        `running_sums` and `last` selected point, whose kernel column has not
+        been added yet. Otherwise, the running sums are initialised with the
+        diagonal of the kernel matrix.
+    resume: bool
+        whether `running_sums` already include the columns of all previously
+        selected points, as after a search stopped by `trace` rejecting a
+        point, in which case the search continues from their minimum.
+        Default: False.
+    callback: Optional[Callable[[ThinningProgress], None]]
+        if provided, function called every `callback_interval` steps and after
+        the last step with the progress of the search.
+    callback_interval: int
+        number of steps between calls of `callback`. Default: 1.
+    profile: Optional[ThinningProfile]
+        if provided, filled in with measurements of the search.
+    trace: Optional[_KsdTrace]
+        if provided, the KSD of the selected points is recorded in the trace,
+        which can stop the search before `n_points` points are selected. A
+        point rejected by the trace is not returned.
+    rows: Optional[np.ndarray]
+        if provided, row indices in the original sample of the points of
+        `integrand`, used to report the index of the selected points to
+        `callback`. The returned indices are not mapped.
 
     Returns
     -------
     np.ndarray
         indices of selected points
     """
+    assert last is None or running_sums is not None, 'running_sums must be provided with last.'
+    assert not resume or running_sums is not None and last is None, 'resume requires running_sums and no last.'
+    if backend not in ('thread', 'process'):
+        raise ValueError('Incorrect backend type.')
+    assert cache is None or backend == 'thread', 'cache is only supported by the thread backend.'
+
     # Pre-allocate the index array
     idx = np.empty(n_points, dtype=np.uint32)
 
-    # Array for the running sums
-    k0 = integrand(slice(None), slice(None))
+    # Split rows into blocks and blocks into contiguous shards, one per worker
+    n = integrand.n
+    n_jobs = 1 if n_jobs is None else n_jobs
+    assert n_jobs > 0, 'n_jobs must be positive.'
+    blocks = _row_blocks(n, _default_block_size(integrand) if block_size is None else block_size)
+    shards = [shard for shard in np.array_split(np.arange(len(blocks)), n_jobs) if len(shard) > 0]
+    shards = [[blocks[b] for b in shard] for shard in shards]
+    size = blocks[0].stop
+    assert callback_interval > 0, 'callback_interval must be positive.'
 
-    idx[0] = np.argmin(k0)
-    logger.debug('THIN: %d of %d', 1, n_points)
-    for i in range(1, n_points):
-        k0 += 2 * integrand(slice(None), [idx[i - 1]])
-        idx[i] = np.argmin(k0)
-        logger.debug('THIN: %d of %d', i + 1, n_points)
+    # Measurements accumulated over the steps
+    work = integrand.workspace(1)
+    row_bytes = integrand.dtype.itemsize + (0 if work is None else work.nbytes)
+    totals = ThinningProfile()
+    totals.bytes_allocated = len(shards) * size * row_bytes + (n * 8 if running_sums is None else 0)
+    start_time = time.perf_counter()
+
+    with ExitStack() as stack:
+        if backend == 'process':
+            # Running sums live in shared memory, updated by the workers
+            if running_sums is None:
+                k0 = _share_array(np.empty(n), stack, copy=False)
+            else:
+                k0 = _share_array(running_sums, stack, copy=last is not None or resume)
+            pool = stack.enter_context(
+                multiprocessing.Pool(len(shards), _init_worker, (_share_plan(integrand, stack), k0, shards, size))
+            )
+
+            def map_shards(j, cached, target):
+                return pool.starmap(_worker_update, [(shard, j) for shard in range(len(shards))])
+        else:
+            # Array for the running sums, accumulated in double precision even if
+            # the kernel is evaluated in single precision
+            k0 = np.empty(n) if running_sums is None else running_sums
 
+            # Scratch buffers for column blocks, one set per shard
+            buffers = [(np.empty(size, dtype=integrand.dtype), integrand.workspace(size)) for _ in shards]
+            executor = stack.enter_context(ThreadPoolExecutor(len(shards))) if len(shards) > 1 else None
+            map_threads = map if executor is None else executor.map
+
+            def map_shards(j, cached, target):
+                update = partial(_update_shard, integrand, k0)
+                return map_threads(update, shards, buffers, repeat(j), repeat(cached), repeat(target))
+
+        def step(j):
+            """Update the running sums and return the index and value of the global minimum"""
+            # Reuse a cached column or evaluate a new one into an array to be cached
+            cached = target = None
+            if j is not None and cache is not None:
+                cached = cache.get(j)
+                if cached is None and cache.accepts(n * integrand.dtype.itemsize):
+                    target = np.empty(n, dtype=integrand.dtype)
+                    totals.bytes_allocated += target.nbytes
+            if j is not None:
+                if cached is None:
+                    totals.columns += 1
+                else:
+                    totals.cached_columns += 1
+            best = best_value = None
+            for k, value, kernel_time, search_time in map_shards(j, cached, target):
+                totals.kernel_time += kernel_time
+                totals.search_time += search_time
+                if best is None or value < best_value:
+                    best, best_value = k, value
+            if target is not None:
+                cache.put(j, target)
+            return best, best_value
+
+        def report(i, objective):
+            """Pass the progress after step i to the callback"""
+            callback(ThinningProgress(
+                step=i + 1,
+                n_points=n_points,
+                index=int(idx[i] if rows is None else rows[idx[i]]),
+                objective=float(objective),
+                ksd=trace.values[-1],
+                elapsed=time.perf_counter() - start_time,
+                kernel_time=totals.kernel_time,
+                search_time=totals.search_time,
+            ))
+
+        if trace is None:
+            trace = _KsdTrace()
+        objective = None
+        for i in range(n_points):
+            previous = objective
+            if i == 0 and resume:
+                # The running sums are up to date, so the next point is their minimum
+                idx[i] = np.argmin(running_sums)
+                objective = running_sums[idx[i]]
+            else:
+                idx[i], objective = step(last if i == 0 else idx[i - 1])
+                totals.steps += 1
+            stop = trace.add(objective)
+            if trace.rejected:
+                # The point does not improve the KSD enough and is not selected
+                if callback is not None and i > 0 and i % callback_interval != 0:
+                    report(i - 1, previous)
+                idx = idx[:i]
+                break
+            if callback is not None and ((i + 1) % callback_interval == 0 or i + 1 == n_points or stop):
+                report(i, objective)
+            if stop:
+                idx = idx[:i + 1]
+                break
+
+        if backend == 'process' and running_sums is not None:
+            handles = []
+            running_sums[:] = _attach_array(k0, handles)
+            for shm in handles:
+                shm.close()
+
+    totals.wall_time = time.perf_counter() - start_time
+    logger.debug('THIN: %r', totals)
+    if profile is not None:
+        vars(profile).update(vars(totals))
     return idx
 
 
+def _greedy_search_multi(
+        n_points: int,
+        integrand: KernelPlan,
+        points_per_step: int,
+        block_size: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        pool_size: Optional[int] = None,
+) -> np.ndarray:
+    """Select points minimising total kernel Stein distance, several points per step
+
+    In each step, the `pool_size` points with the smallest running sums are
+    taken as candidates and the next `points_per_step` points are selected
+    from them one at a time, as in `_greedy_search`, with the running sums of
+    the candidates corrected for the points already selected in the step
+    using the kernel matrix of the candidates. The running sums of all points
+    are then updated with the kernel columns of the selected points, which
+    are evaluated together with `KernelPlan.columns`.
+
+    The selection matches `_greedy_search` as long as each point it would
+    select is among the candidates, which always holds for one point per step.
+
+    Parameters
+    ----------
+    n_points: int
+        number of points to select.
+    integrand: KernelPlan
+        kernel plan returning values of the integrand in the KSD integral.
+    points_per_step: int
+        number of points selected in each step.
+    block_size: Optional[int]
+        number of rows of the kernel block evaluated at once. By default, the
+        temporary arrays of a block hold at most `CHUNK_ELEMENTS` elements, as
+        in `_greedy_search`.
+    n_jobs: Optional[int]
+        number of threads evaluating blocks of rows. Default: 1.
+    pool_size: Optional[int]
+        number of candidates for the points selected in a step. The default,
+        the larger of 16 * `points_per_step` and sqrt(n * `points_per_step`),
+        makes the kernel matrix of the candidates at most as costly as the
+        kernel columns for large n.
+
+    Returns
+    -------
+    np.ndarray
+        indices of selected points
+    """
+    assert points_per_step > 0, 'points_per_step must be positive.'
+    n = integrand.n
+    if pool_size is None:
+        pool_size = max(16 * points_per_step, int(np.sqrt(n * points_per_step)))
+    pool_size = min(n, pool_size)
+    assert pool_size >= min(n, points_per_step), 'pool_size must be at least points_per_step.'
+    n_jobs = 1 if n_jobs is None else n_jobs
+    assert n_jobs > 0, 'n_jobs must be positive.'
+    if block_size is None:
+        block_size = _default_block_size(integrand, points_per_step)
+    blocks = _row_blocks(n, block_size)
+
+    idx = np.empty(n_points, dtype=np.uint32)
+    k0 = np.empty(n)
+    for rows in blocks:
+        k0[rows] = integrand.diagonal(rows)
+
+    def update(rows, points):
+        k0[rows] += 2 * np.sum(integrand.columns(points, rows), axis=0, dtype=np.float64)
+
+    with ExitStack() as stack:
+        executor = stack.enter_context(ThreadPoolExecutor(n_jobs)) if n_jobs > 1 else None
+        map_threads = map if executor is None else executor.map
+        for start in range(0, n_points, points_per_step):
+            stop = min(start + points_per_step, n_points)
+
+            # Candidates in index order, so that ties are broken as in `_greedy_search`
+            pool = np.sort(np.argpartition(k0, pool_size - 1)[:pool_size]) if pool_size < n else np.arange(n)
+            kpool = integrand.block(pool, pool).astype(np.float64)
+            objective = k0[pool]
+            for i in range(start, stop):
+                best = np.argmin(objective)
+                idx[i] = pool[best]
+                objective += 2 * kpool[:, best]
+
+            if stop < n_points:
+                list(map_threads(update, blocks, repeat(idx[start:stop])))
+
+    return idx
+
+
+def _greedy_search_sparse(n_points: int, integrand: WendlandKernelPlan) -> np.ndarray:
+    """Select points minimising total kernel Stein distance for a compactly supported kernel
+
+    Each step only updates the running sums of the points within the support
+    of the kernel around the selected point. The minimum is tracked with a
+    heap holding an entry for every value a running sum has taken, where
+    entries that no longer match the running sum are discarded when they
+    reach the top. Ties are broken by index, as in `_greedy_search`.
+
+    Parameters
+    ----------
+    n_points: int
+        number of points to select.
+    integrand: WendlandKernelPlan
+        kernel plan providing sparse kernel columns.
+
+    Returns
+    -------
+    np.ndarray
+        indices of selected points
+    """
+    idx = np.empty(n_points, dtype=np.uint32)
+    k0 = integrand.diagonal().astype(np.float64)
+    heap = list(zip(k0.tolist(), range(integrand.n)))
+    heapq.heapify(heap)
+    for i in range(n_points):
+        while heap[0][0] != k0[heap[0][1]]:
+            heapq.heappop(heap)
+        j = heap[0][1]
+        idx[i] = j
+        if i + 1 < n_points:
+            rows, vals = integrand.sparse_column(j)
+            k0[rows] += 2 * vals
+            for value, row in zip(k0[rows].tolist(), rows.tolist()):
+                heapq.heappush(heap, (value, row))
+    return idx
+
+
+ArrayOrPathT = np.ndarray | str | os.PathLike
+
+
+def _load_array(arr: ArrayOrPathT, dtype: Any = None) -> np.ndarray:
+    """Memory-map an array stored in a .npy file and convert it to `dtype` if needed"""
+    if isinstance(arr, (str, os.PathLike)):
+        arr = np.load(arr, mmap_mode='r')
+    return np.asanyarray(arr, dtype=dtype)
+
+
+GradientT = ArrayOrPathT | Callable[[np.ndarray], np.ndarray]
+
+
+def _gradient_batch(gradient: Callable[[np.ndarray], np.ndarray], points: np.ndarray) -> np.ndarray:
+    """Evaluate a gradient function at each row of an array"""
+    return np.array([gradient(x) for x in points], dtype=np.float64).reshape(points.shape)
+
+
+def _evaluate_gradient(
+        sample: np.ndarray,
+        gradient: Callable[[np.ndarray], np.ndarray],
+        n_jobs: Optional[int] = None,
+        backend: str = 'thread',
+        batch_size: int = 1024,
+) -> np.ndarray:
+    """Evaluate a gradient function at each point of a sample
+
+    The function is evaluated once for each distinct row, which matters for
+    chains with many rejected proposals, in batches of `batch_size` points
+    distributed over `n_jobs` threads or processes. With processes, the
+    function must be picklable.
+
+    Parameters
+    ----------
+    sample: np.ndarray
+        n x d array where each row is a sample point.
+    gradient: Callable[[np.ndarray], np.ndarray]
+        function returning the gradient of the log target at a point.
+    n_jobs: Optional[int]
+        number of workers. Default: 1.
+    backend: str
+        either 'thread' (default) or 'process'.
+    batch_size: int
+        number of points evaluated by a worker at once.
+
+    Returns
+    -------
+    np.ndarray
+        n x d array of gradients at the points of `sample`.
+    """
+    if backend not in ('thread', 'process'):
+        raise ValueError('Incorrect backend type.')
+    n_jobs = 1 if n_jobs is None else n_jobs
+    assert n_jobs > 0, 'n_jobs must be positive.'
+    unique, inverse = np.unique(sample, axis=0, return_inverse=True)
+    batches = [unique[rows] for rows in _row_blocks(unique.shape[0], batch_size)]
+    evaluate = partial(_gradient_batch, gradient)
+    if n_jobs == 1:
+        values = list(map(evaluate, batches))
+    else:
+        executor_cls = ThreadPoolExecutor if backend == 'thread' else ProcessPoolExecutor
+        with executor_cls(n_jobs) as executor:
+            values = list(executor.map(evaluate, batches))
+    return np.concatenate(values)[inverse.reshape(-1)]
+
+
+def _load_gradient(
+        sample: np.ndarray,
+        gradient: GradientT,
+        dtype: Any = None,
+        n_jobs: Optional[int] = None,
+        backend: str = 'thread',
+) -> np.ndarray:
+    """Load an array of gradients or evaluate a gradient function at the sample points"""
+    if callable(gradient):
+        return np.asarray(_evaluate_gradient(sample, gradient, n_jobs=n_jobs, backend=backend), dtype=dtype)
+    return _load_array(gradient, dtype)
+
+
 def _validate_and_standardize(sample, gradient, standardize):
+    """Check the sample and gradient and compute the standardisation scale
+
+    The arrays are read in chunks and are not copied, so they can be
+    memory-mapped. Instead of standardised copies, the scale is returned
+    for the kernel to apply.
+    """
     assert sample.ndim == 2, 'sample is not two-dimensional.'
     n, d = sample.shape
     assert n > 0 and d > 0, 'sample is empty.'
-    assert not np.any(np.isnan(sample)), 'sample contains NaNs.'
-    assert not np.any(np.isinf(sample)), 'sample contains infs.'
-
     assert gradient.shape == sample.shape, f'Dimensions of sample {sample.shape} and gradient {gradient.shape} are inconsistent.'
-    assert not np.any(np.isnan(gradient)), 'gradient contains NaNs.'
-    assert not np.any(np.isinf(gradient)), 'gradient contains infs.'
 
-    # Standardisation
-    if standardize:
-        loc = np.mean(sample, axis=0)
-        scl = np.mean(np.abs(sample - loc), axis=0)
-        assert np.min(scl) > 0, 'Too few unique samples in smp.'
-        sample = sample / scl
-        gradient = gradient * scl
+    blocks = _row_blocks(n, max(1, CHUNK_ELEMENTS // d))
+    for rows in blocks:
+        assert not np.any(np.isnan(sample[rows])), 'sample contains NaNs.'
+        assert not np.any(np.isinf(sample[rows])), 'sample contains infs.'
+    for rows in blocks:
+        assert not np.any(np.isnan(gradient[rows])), 'gradient contains NaNs.'
+        assert not np.any(np.isinf(gradient[rows])), 'gradient contains infs.'
 
-    return sample, gradient
+    # Standardisation
+    if not standardize:
+        return None
+    loc = sum(np.sum(sample[rows], axis=0, dtype=np.float64) for rows in blocks) / n
+    scl = sum(np.sum(np.abs(sample[rows] - loc), axis=0) for rows in blocks) / n
+    assert np.min(scl) > 0, 'Too few unique samples in smp.'
+    return scl
 
 
 def _make_stein_integrand(
-        sample: np.ndarray,
-        gradient: np.ndarray,
+        sample: ArrayOrPathT,
+        gradient: GradientT,
         *,
         standardize: bool = True,
         preconditioner: str = 'id',
         vfk0: Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray] = None,
+        dtype: Any = None,
+        n_jobs: Optional[int] = None,
+        backend: str = 'thread',
 ):
     # Argument checks
-    sample, gradient = _validate_and_standardize(sample, gradient, standardize)
+    sample = _load_array(sample)
+    gradient = _load_gradient(sample, gradient, n_jobs=n_jobs, backend=backend)
+    scale = _validate_and_standardize(sample, gradient, standardize)
 
-    # Vectorised Stein kernel function
+    # The default kernel is prepared once for the whole sample, and converts
+    # blocks of points to `dtype` as they are read
     if vfk0 is None:
-        vfk0 = make_imq(sample, preconditioner)
+        return make_imq_plan(sample, gradient, preconditioner, scale=scale, dtype=dtype)
+    return PairwiseKernelPlan(vfk0, _load_array(sample, dtype), _load_array(gradient, dtype), scale=scale)
+
+
+# Largest log weight in `_WeightedKernelPlan`, so that products of two weights
+# and a kernel value stay finite in double precision
+MAX_LOG_WEIGHT = 300.
+
+
+class _WeightedKernelPlan(KernelPlan):
+    """Stein kernel multiplied by importance weights of both points
+
+    The weights are given in the log domain, shifted by
+    `_make_stein_gf_integrand` so that the smallest weight is 1, since the
+    points with the smallest weights are the ones the greedy search selects.
+    They are exponentiated once and kept in double precision whatever the
+    type of the kernel, and weighted values are computed in double
+    precision. Log weights above `MAX_LOG_WEIGHT` are capped, which only
+    changes points whose diagonal exceeds that of the others by a factor of
+    about exp(600).
+    """
+
+    def __init__(self, plan: KernelPlan, log_weights: np.ndarray):
+        self.plan = plan
+        self.n = plan.n
+        self.dtype = np.dtype(np.float64)
+        self.weights = np.exp(np.minimum(log_weights, MAX_LOG_WEIGHT))
+
+    def __call__(self, ind1, ind2):
+        return self.weights[ind1] * self.weights[ind2] * self.plan(ind1, ind2)
+
+    def workspace(self, size):
+        return self.plan.workspace(size)
 
-    def integrand(ind1, ind2):
-        return vfk0(sample[ind1], sample[ind2], gradient[ind1], gradient[ind2])
+    def diagonal(self, rows=slice(None)):
+        return self.weights[rows] ** 2 * self.plan.diagonal(rows)
 
-    return integrand
+    def block(self, rows, cols):
+        return np.outer(self.weights[rows], self.weights[cols]) * self.plan.block(rows, cols)
+
+    def columns(self, cols, rows=slice(None)):
+        return np.outer(self.weights[cols], self.weights[rows]) * self.plan.columns(cols, rows)
+
+    def column(self, j, rows=slice(None), out=None, work=None):
+        out = self.plan.column(j, rows, out=out, work=work).astype(self.dtype, copy=False)
+        out *= self.weights[rows]
+        out *= self.weights[j]
+        return out
+
+    def subset(self, indices):
+        plan = copy.copy(self)
+        plan.plan = self.plan.subset(indices)
+        plan.weights = self.weights[indices]
+        plan.n = len(indices)
+        return plan
 
 
 def _make_stein_gf_integrand(
-        sample: np.ndarray,
-        log_p: np.ndarray,
-        log_q: np.ndarray,
-        gradient_q: np.ndarray,
+        sample: ArrayOrPathT,
+        log_p: ArrayOrPathT,
+        log_q: ArrayOrPathT,
+        gradient_q: ArrayOrPathT,
         *,
         standardize: bool = True,
         preconditioner: str = 'id',
         vfk0: Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray] = None,
         range_cap: float = None,
+        dtype: Any = None,
 ):
     # Argument checks
-    sample, gradient_q = _validate_and_standardize(sample, gradient_q, standardize)
+    sample = _load_array(sample)
+    gradient_q = _load_array(gradient_q)
+    scale = _validate_and_standardize(sample, gradient_q, standardize)
     n, _ = sample.shape
 
     def validate_log_prob(vals, var_name):
+        vals = _load_array(vals)
         assert vals.ndim == 1 or vals.ndim == 2 and vals.shape[1] == 1, f'{var_name} must be a vector.'
         assert vals.shape[0] == n, f'Dimensions of sample and {var_name} are inconsistent.'
         assert not np.any(np.isnan(vals)), f'{var_name} contains NaNs.'
@@ -116,7 +898,9 @@ def _make_stein_gf_integrand(
 
     # Vectorised Stein kernel function
     if vfk0 is None:
-        vfk0 = make_imq(sample, preconditioner)
+        plan = make_imq_plan(sample, gradient_q, preconditioner, scale=scale, dtype=dtype)
+    else:
+        plan = PairwiseKernelPlan(vfk0, _load_array(sample, dtype), _load_array(gradient_q, dtype), scale=scale)
 
     log_p = validate_log_prob(log_p, 'log_p')
     log_q = validate_log_prob(log_q, 'log_q')
@@ -132,29 +916,241 @@ def _make_stein_gf_integrand(
         assert range_cap > 0, 'range_cap must be positive'
         np.clip(log_q_m_p, a_min=None, a_max=range_cap, out=log_q_m_p)
 
-    def integrand(ind1, ind2):
-        return (
-            np.exp(log_q_m_p[ind1] + log_q_m_p[ind2]) * vfk0(sample[ind1], sample[ind2], gradient_q[ind1], gradient_q[ind2])
-        )
+    return _WeightedKernelPlan(plan, log_q_m_p)
+
+
+def _unique_rows(sample: np.ndarray, gradient: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the distinct points of a sample, such as the repeated draws of rejected proposals
+
+    Rows are compared on the point and its gradient together.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        sorted array of the index of the first occurrence of each distinct
+        point, array mapping each row to its distinct point, and the number
+        of occurrences of each distinct point.
+    """
+    rows = np.concatenate([sample, gradient], axis=1)
+    _, first, inverse, counts = np.unique(rows, axis=0, return_index=True, return_inverse=True, return_counts=True)
+    # Number distinct points in order of first occurrence
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)], counts[order]
 
-    return integrand
+
+def _grid_cells(x: np.ndarray, width: float) -> np.ndarray:
+    """Return the position of the first point in each occupied cell of a grid with spacing `width`"""
+    cells = np.floor(x / width).astype(np.int64)
+    shape = np.max(cells, axis=0) + 1
+    if np.sum(np.log2(shape)) < 62:
+        # Number the cells so that they are compared as scalars rather than rows
+        cells = np.ravel_multi_index(tuple(cells.T), shape)
+        return np.unique(cells, return_index=True)[1]
+    return np.unique(cells, axis=0, return_index=True)[1]
+
+
+def _prefilter(integrand: KernelPlan, method: str, n_candidates: int) -> np.ndarray:
+    """Select a pool of candidate points for the greedy search
+
+    With method 'diagonal', the `n_candidates` points with the smallest values
+    on the diagonal of the Stein kernel matrix are kept. The diagonal is a
+    penalty in every step of the greedy search, but ranking by it alone
+    favours points close to modes, so the pool must not be too small,
+    particularly in low dimensions.
+
+    With method 'grid', the standardised sample is binned on a regular grid,
+    coarsened until there are at most `n_candidates` occupied cells, and the
+    point with the smallest diagonal element in each cell is kept. Any
+    remaining places in the pool are filled by diagonal ranking. This spreads
+    the candidates over the sample and drops near-duplicate points. Binning
+    requires a copy of the sample.
+
+    Returns
+    -------
+    np.ndarray
+        sorted array of indices of the candidate points.
+    """
+    assert n_candidates > 0, 'n_candidates must be positive.'
+    n = integrand.n
+    if n_candidates >= n:
+        return np.arange(n)
+    order = np.argsort(integrand.diagonal(), kind='stable')
+    if method == 'diagonal':
+        return np.sort(order[:n_candidates])
+    if method != 'grid':
+        raise ValueError('Incorrect prefilter type.')
+
+    x = np.asarray(integrand._points(order)[0], dtype=np.float64)
+    x -= np.min(x, axis=0)
+    width = np.max(x) / n ** (1 / x.shape[1])
+    if width == 0:
+        first = np.arange(1)
+    else:
+        # Points are sorted by diagonal, so the first point found in each cell
+        # has the smallest diagonal element in the cell
+        while True:
+            first = _grid_cells(x, width)
+            if len(first) <= n_candidates:
+                break
+            width *= 2
+    rest = np.ones(n, dtype=bool)
+    rest[first] = False
+    candidates = np.concatenate([order[first], order[rest][:n_candidates - len(first)]])
+    return np.sort(candidates)
+
+
+def _selection_ksd(integrand: KernelPlan, idx: np.ndarray) -> float:
+    """Kernel Stein discrepancy of the selected points, evaluated in double precision"""
+    return np.sqrt(np.sum(integrand.block(idx, idx), dtype=np.float64)) / len(idx)
+
+
+def selection_ksd(
+        sample: ArrayOrPathT,
+        gradient: GradientT,
+        idx: np.ndarray,
+        standardize: bool = True,
+        preconditioner: str = 'id',
+        dtype: Any = None,
+) -> float:
+    """Compute the kernel Stein discrepancy of points selected from a sample
+
+    The Stein kernel is set up for the whole sample in the same way as in
+    `thin`, so the KSD of selections obtained with different options, e.g.
+    with and without `prefilter`, can be compared directly.
+
+    Parameters
+    ----------
+    sample: np.ndarray | str | os.PathLike
+        n x d array where each row is a sample point.
+    gradient: np.ndarray | str | os.PathLike | Callable
+        n x d array where each row is a gradient of the log target.
+        Alternatively, a function returning the gradient at a point, which is
+        evaluated once for each distinct row of `sample`.
+    idx: np.ndarray
+        array shaped (m,) of row indices of the selected points.
+    standardize: bool
+        whether or not to standardise the columns of `sample`, as in `thin`.
+    preconditioner: str
+        preconditioner to be used, as in `thin`.
+    dtype: Any
+        floating-point type used to evaluate the kernel. By default, the type of
+        the arrays is used.
+
+    Returns
+    -------
+    float
+        KSD of the empirical distribution of the selected points.
+    """
+    integrand = _make_stein_integrand(
+        sample=sample,
+        gradient=gradient,
+        standardize=standardize,
+        preconditioner=preconditioner,
+        dtype=dtype,
+    )
+    return _selection_ksd(integrand, idx)
+
+
+def selection_weights(
+        sample: ArrayOrPathT,
+        gradient: GradientT,
+        idx: np.ndarray,
+        standardize: bool = True,
+        preconditioner: str = 'id',
+        dtype: Any = None,
+        max_iter: int = 1000,
+        tol: float = 1e-6,
+) -> Tuple[np.ndarray, float]:
+    """Find the weights of points selected from a sample that minimise their KSD
+
+    The Stein kernel is set up for the whole sample in the same way as in
+    `selection_ksd`. The weights are optimised on the distinct selected
+    points with `stein.optimal_weights`, starting from the number of times
+    each of them was selected, so that the result is never worse than the
+    equally weighted selection and can be compared with `selection_ksd` for
+    more points.
+
+    Parameters
+    ----------
+    sample: np.ndarray | str | os.PathLike
+        n x d array where each row is a sample point.
+    gradient: np.ndarray | str | os.PathLike | Callable
+        n x d array where each row is a gradient of the log target.
+        Alternatively, a function returning the gradient at a point, which is
+        evaluated once for each distinct row of `sample`.
+    idx: np.ndarray
+        array shaped (m,) of row indices of the selected points.
+    standardize: bool
+        whether or not to standardise the columns of `sample`, as in `thin`.
+    preconditioner: str
+        preconditioner to be used, as in `thin`.
+    dtype: Any
+        floating-point type used to evaluate the kernel. By default, the type of
+        the arrays is used.
+    max_iter: int
+        maximum number of iterations of the solver. Default: 1000.
+    tol: float
+        relative duality gap at which the solver stops. Default: 1e-6.
+
+    Returns
+    -------
+    Tuple[np.ndarray, float]
+        array shaped (m,) of weights of the selected points summing to 1, where
+        the weight of a point selected several times is given to its first
+        occurrence in `idx`, and the KSD of the weighted points.
+    """
+    integrand = _make_stein_integrand(
+        sample=sample,
+        gradient=gradient,
+        standardize=standardize,
+        preconditioner=preconditioner,
+        dtype=dtype,
+    )
+    idx = np.asarray(idx)
+    unique, first, counts = np.unique(idx, return_index=True, return_counts=True)
+    weights, value = optimal_weights(integrand.subset(unique), len(unique), weights=counts, max_iter=max_iter, tol=tol)
+    result = np.zeros(len(idx))
+    result[first] = weights
+    return result, value
 
 
 def thin(
-        sample: np.ndarray,
-        gradient: np.ndarray,
+        sample: ArrayOrPathT,
+        gradient: GradientT,
         n_points: int,
         standardize: bool = True,
         preconditioner: str = 'id',
-) -> np.ndarray:
+        block_size: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        cache: Optional[ColumnCache] = None,
+        dtype: Any = None,
+        backend: str = 'thread',
+        prefilter: Optional[str] = None,
+        n_candidates: Optional[int] = None,
+        points_per_step: Optional[int] = None,
+        callback: Optional[Callable[[ThinningProgress], None]] = None,
+        callback_interval: int = 1,
+        profile: Optional[ThinningProfile] = None,
+        target_ksd: Optional[float] = None,
+        rtol: Optional[float] = None,
+        return_ksd: bool = False,
+        deduplicate: bool = False,
+) -> np.ndarray | Tuple[np.ndarray, np.ndarray]:
     """Optimally select m points from n > m samples generated from a target distribution of d dimensions.
 
+    The arrays can be passed as paths to .npy files, which are memory-mapped.
+    Memory-mapped arrays are only read in chunks and are never copied as a whole.
+
     Parameters
     ----------
-    sample: np.ndarray
+    sample: np.ndarray | str | os.PathLike
         n x d array where each row is a sample point.
-    gradient: np.ndarray
+    gradient: np.ndarray | str | os.PathLike | Callable
         n x d array where each row is a gradient of the log target.
+        Alternatively, a function returning the gradient at a point, which is
+        evaluated once for each distinct row of `sample`, using `n_jobs` workers.
     n_points: int
         integer specifying the desired number of points.
     standardize: bool
@@ -162,36 +1158,469 @@ def thin(
         whether or not to standardise the columns of `sample` around means
         using the mean absolute deviation from the mean as the scale.
     preconditioner: str
-        optional string, either 'id' (default), 'med', 'sclmed', or
-        'smpcov', specifying the preconditioner to be used. Alternatively,
-        a numeric string can be passed as the single length-scale parameter
-        of an isotropic kernel.
+        optional string, either 'id' (default), 'med', 'sclmed', 'smpcov',
+        'smpvar' or 'lowrank' (see `make_precon`), specifying the
+        preconditioner to be used. Alternatively, a numeric string can be
+        passed as the single length-scale parameter of an isotropic kernel.
+    block_size: Optional[int]
+        if provided, the kernel is evaluated for at most `block_size` points at
+        a time, which bounds the memory used by temporary arrays. By default,
+        the block size only depends on the dimension: blocks have at most
+        `MAX_BLOCK_ROWS` rows, and their temporary arrays hold at most
+        `CHUNK_ELEMENTS` elements.
+    n_jobs: Optional[int]
+        number of threads (or processes, see `backend`) used to evaluate the
+        kernel and search for the next point. Blocks are distributed between
+        the workers, and the result is identical to that of a single worker
+        for the same `block_size`, including the default. Default: 1.
+    cache: Optional[ColumnCache]
+        if provided, kernel columns of selected points are cached and reused
+        when a point is selected more than once.
+    dtype: Any
+        floating-point type used to evaluate the kernel. Arrays of a different
+        type are converted block by block as the kernel is evaluated, so
+        memory-mapped arrays are still not copied. Passing np.float32 halves
+        the arithmetic cost of kernel evaluation, while the running sums used
+        to select points are still accumulated in double precision. By
+        default, the type of the arrays is used.
+    backend: str
+        either 'thread' (default) or 'process'. With 'process', `n_jobs` worker
+        processes share the sample and the running sums through shared memory,
+        which avoids contention for the interpreter lock when n is very large.
+        The selection is the same as with threads. The sample is copied to
+        shared memory once, and `cache` is not supported.
+    prefilter: Optional[str]
+        if provided, either 'diagonal' or 'grid', specifying a cheap pass that
+        reduces the sample to `n_candidates` candidate points before the exact
+        greedy search: 'diagonal' keeps the points with the smallest diagonal
+        elements of the Stein kernel matrix, 'grid' keeps one point per cell of
+        a grid over the standardised sample. The kernel is still set up for the
+        whole sample. Use `selection_ksd` to compare the result with an
+        unfiltered run.
+    n_candidates: Optional[int]
+        size of the candidate pool, required if `prefilter` is provided.
+    points_per_step: Optional[int]
+        if provided, the greedy search selects this many points per step from
+        a pool of candidates, correcting for the interaction between the points
+        selected in the same step, and evaluates their kernel columns together.
+        This reduces the number of passes over the sample by this factor at a
+        small loss of quality. `cache`, `callback`, `profile`, the stopping
+        rules and the 'process' backend are not supported in this mode.
+    callback: Optional[Callable[[ThinningProgress], None]]
+        if provided, function called with a `ThinningProgress` every
+        `callback_interval` steps of the greedy search and after the last step,
+        reporting the elapsed time split into kernel evaluation and search.
+    callback_interval: int
+        number of steps between calls of `callback`. Default: 1.
+    profile: Optional[ThinningProfile]
+        if provided, filled in with the time spent in each phase, the number of
+        kernel columns evaluated and the memory allocated by the greedy search.
+    target_ksd: Optional[float]
+        if provided, the search stops as soon as the KSD of the selected points
+        is at most this value, so that `n_points` is a maximum.
+    rtol: Optional[float]
+        if provided, the search stops at the first point that does not reduce
+        the smallest KSD of the selection so far by at least this fraction,
+        which is not selected.
+    return_ksd: bool
+        whether to also return the KSD of the first i selected points for each
+        i. The values are obtained from the running sums of the greedy search,
+        without evaluating the kernel again. Default: False.
+    deduplicate: bool
+        whether to run the greedy search on the distinct rows of `sample` and
+        `gradient` only. Repeated rows, e.g. from rejected proposals in a
+        Metropolis chain, always have equal running sums, so the selection is
+        unchanged while each step costs less in proportion to the number of
+        distinct rows. The first occurrence of a repeated row is returned.
+        Standardisation and the preconditioner are still computed from the
+        whole sample. Requires a copy of the sample. Default: False.
 
     Returns
     -------
-    np.ndarray
+    np.ndarray | Tuple[np.ndarray, np.ndarray]
         array shaped (m,) containing the row indices in `sample` (and `gradient`) of the
-        selected points.
+        selected points, where m is at most `n_points` if the search is stopped early,
+        and, if `return_ksd` is True, array shaped (m,) containing the KSD of each
+        initial part of the selection.
     """
     integrand = _make_stein_integrand(
         sample=sample,
         gradient=gradient,
         standardize=standardize,
         preconditioner=preconditioner,
+        dtype=dtype,
+        n_jobs=n_jobs,
+        backend=backend,
     )
-    return _greedy_search(n_points, integrand)
+    # Row indices of the points of the search, if not all rows
+    candidates = None
+    if deduplicate:
+        candidates, _, _ = _unique_rows(integrand.sample, integrand.gradient)
+        if len(candidates) < integrand.n:
+            integrand = integrand.subset(candidates)
+        else:
+            candidates = None
+    if prefilter is not None:
+        assert n_candidates is not None, 'n_candidates must be provided with prefilter.'
+        filtered = _prefilter(integrand, prefilter, n_candidates)
+        integrand = integrand.subset(filtered)
+        candidates = filtered if candidates is None else candidates[filtered]
+    trace = _KsdTrace(target_ksd, rtol)
+    if points_per_step is None:
+        idx = _greedy_search(
+            n_points, integrand, block_size=block_size, n_jobs=n_jobs, cache=cache, backend=backend,
+            callback=callback, callback_interval=callback_interval, profile=profile, trace=trace,
+            rows=candidates,
+        )
+    else:
+        assert cache is None and backend == 'thread', 'points_per_step is only supported by the thread backend without cache.'
+        assert callback is None and profile is None, 'points_per_step does not support callback and profile.'
+        assert target_ksd is None and rtol is None and not return_ksd, 'points_per_step does not support KSD tracking.'
+        idx = _greedy_search_multi(n_points, integrand, points_per_step, block_size=block_size, n_jobs=n_jobs)
+    if candidates is not None:
+        idx = candidates[idx].astype(idx.dtype)
+    return (idx, np.array(trace.values)) if return_ksd else idx
+
+
+class SteinThinner:
+    """Stein thinning of a sample that can be extended step by step
+
+    The kernel plan, including the standardisation and the preconditioner, is
+    prepared once, and the running sums of the greedy search are kept between
+    calls, so that `extend` continues the selection where it stopped. The
+    points selected by a sequence of calls are the same as those selected by
+    `thin` for their total number.
+
+    The state of the search can be saved to a file and loaded for the same
+    sample and gradients, to continue a long run later.
+
+    Parameters
+    ----------
+    sample: np.ndarray | str | os.PathLike
+        n x d array where each row is a sample point.
+    gradient: np.ndarray | str | os.PathLike | Callable
+        n x d array where each row is a gradient of the log target.
+        Alternatively, a function returning the gradient at a point, which is
+        evaluated once for each distinct row of `sample`, using `n_jobs` workers.
+    standardize: bool
+        whether or not to standardise the columns of `sample`, as in `thin`.
+    preconditioner: str
+        preconditioner to be used, as in `thin`.
+    block_size: Optional[int]
+        number of rows of a kernel column evaluated at once, as in `thin`.
+    n_jobs: Optional[int]
+        number of workers, as in `thin`.
+    cache: Optional[ColumnCache]
+        if provided, kernel columns of selected points are cached, as in `thin`.
+    dtype: Any
+        floating-point type used to evaluate the kernel, as in `thin`.
+    backend: str
+        either 'thread' (default) or 'process', as in `thin`. With 'process',
+        each call of `extend` starts a new pool of workers and copies the
+        sample and gradients to shared memory again, so few calls selecting
+        many points each are cheaper than many short ones.
+    """
+
+    def __init__(
+            self,
+            sample: ArrayOrPathT,
+            gradient: GradientT,
+            standardize: bool = True,
+            preconditioner: str = 'id',
+            block_size: Optional[int] = None,
+            n_jobs: Optional[int] = None,
+            cache: Optional[ColumnCache] = None,
+            dtype: Any = None,
+            backend: str = 'thread',
+    ):
+        self.integrand = _make_stein_integrand(
+            sample=sample,
+            gradient=gradient,
+            standardize=standardize,
+            preconditioner=preconditioner,
+            dtype=dtype,
+            n_jobs=n_jobs,
+            backend=backend,
+        )
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+        self.cache = cache
+        self.backend = backend
+        self.indices = np.empty(0, dtype=np.uint32)
+        self.running_sums = np.empty(self.integrand.n)
+        self.trace = _KsdTrace()
+
+    @property
+    def ksd(self) -> np.ndarray:
+        """KSD of the first i selected points for each i"""
+        return np.array(self.trace.values)
+
+    def extend(self, n_points: int, target_ksd: Optional[float] = None, rtol: Optional[float] = None) -> np.ndarray:
+        """Select more points
+
+        Parameters
+        ----------
+        n_points: int
+            maximum number of points to add to the selection.
+        target_ksd: Optional[float]
+            if provided, stop as soon as the KSD of the selection is at most this value.
+        rtol: Optional[float]
+            if provided, stop at the first point that does not reduce the smallest
+            KSD of the selection so far by at least this fraction, which is not
+            selected. The next call starts with that point again.
+
+        Returns
+        -------
+        np.ndarray
+            array containing the row indices of the new points.
+        """
+        assert n_points > 0, 'n_points must be positive.'
+        self.trace.target_ksd = target_ksd
+        self.trace.rtol = rtol
+        idx = _greedy_search(
+            n_points,
+            self.integrand,
+            block_size=self.block_size,
+            n_jobs=self.n_jobs,
+            cache=self.cache,
+            backend=self.backend,
+            running_sums=self.running_sums,
+            # After a rejected point, the columns of all selected points have been added
+            last=self.indices[-1] if len(self.indices) > 0 and not self.trace.rejected else None,
+            resume=self.trace.rejected,
+            trace=self.trace,
+        )
+        self.indices = np.concatenate([self.indices, idx])
+        return idx
+
+    def save(self, path: str | os.PathLike):
+        """Save the state of the search to a .npz file
+
+        The file holds the selected indices, the running sums, the KSD trace and
+        the parameters of the kernel, but not the sample and gradients.
+        """
+        plan = self.integrand
+        np.savez(
+            path,
+            indices=self.indices,
+            running_sums=self.running_sums,
+            ksd_total=self.trace.total,
+            ksd=self.ksd,
+            ksd_rejected=self.trace.rejected,
+            linv_type=type(plan.linv).__name__,
+            **{'linv_' + key: value for key, value in plan.linv.state().items()},
+            scale=np.empty(0) if plan.scale is None else plan.scale,
+            c=plan.c,
+            beta=plan.beta,
+            dtype=plan.dtype.str,
+        )
+
+    @classmethod
+    def load(
+            cls,
+            path: str | os.PathLike,
+            sample: ArrayOrPathT,
+            gradient: GradientT,
+            block_size: Optional[int] = None,
+            n_jobs: Optional[int] = None,
+            cache: Optional[ColumnCache] = None,
+            backend: str = 'thread',
+    ) -> 'SteinThinner':
+        """Load the state of a search saved with `save`
+
+        The standardisation and the preconditioner are read from the file
+        rather than computed again.
+
+        Parameters
+        ----------
+        path: str | os.PathLike
+            path to the file written by `save`.
+        sample: np.ndarray | str | os.PathLike
+            the sample used to create the saved thinner.
+        gradient: np.ndarray | str | os.PathLike | Callable
+            the gradients used to create the saved thinner, or a function
+            returning the gradient at a point.
+        block_size, n_jobs, cache, backend:
+            options of the greedy search, as in the constructor.
+
+        Returns
+        -------
+        SteinThinner
+            thinner continuing the saved search.
+        """
+        with np.load(path) as state:
+            dtype = np.dtype(str(state['dtype']))
+            sample = _load_array(sample)
+            gradient = _load_gradient(sample, gradient, n_jobs=n_jobs, backend=backend)
+            assert sample.shape == gradient.shape, f'Dimensions of sample {sample.shape} and gradient {gradient.shape} are inconsistent.'
+            assert state['running_sums'].shape[0] == sample.shape[0], 'Sample size differs from the saved state.'
+            scale = state['scale'] if state['scale'].size > 0 else None
+            args = {key[len('linv_'):]: state[key] for key in state.files if key.startswith('linv_')}
+            linv = PRECONDITIONER_TYPES[str(args.pop('type'))](**args)
+            thinner = object.__new__(cls)
+            thinner.integrand = ImqKernelPlan(
+                sample, gradient, linv, c=float(state['c']), beta=float(state['beta']), scale=scale, dtype=dtype,
+            )
+            thinner.indices = state['indices']
+            thinner.running_sums = state['running_sums']
+            thinner.trace = _KsdTrace()
+            thinner.trace.total = float(state['ksd_total'])
+            thinner.trace.values = state['ksd'].tolist()
+            thinner.trace.best = min(thinner.trace.values, default=np.inf)
+            thinner.trace.rejected = bool(state['ksd_rejected'])
+        thinner.block_size = block_size
+        thinner.n_jobs = n_jobs
+        thinner.cache = cache
+        thinner.backend = backend
+        return thinner
+
+
+def thin_nystrom(
+        sample: ArrayOrPathT,
+        gradient: GradientT,
+        n_points: int,
+        rank: int,
+        standardize: bool = True,
+        preconditioner: str = 'id',
+        block_size: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        dtype: Any = None,
+) -> Tuple[np.ndarray, float]:
+    """Approximately select m points from n > m samples using a low-rank Stein kernel
+
+    The greedy search is run with a Nystrom approximation of the Stein kernel
+    of the given rank (see `kernel.NystromKernelPlan`), so that each step costs
+    O(n r) operations instead of a full kernel evaluation. Building the
+    approximation requires r kernel columns. To assess the approximation,
+    the KSD of the selected points is computed with the exact kernel.
+
+    Parameters
+    ----------
+    sample: np.ndarray | str | os.PathLike
+        n x d array where each row is a sample point.
+    gradient: np.ndarray | str | os.PathLike | Callable
+        n x d array where each row is a gradient of the log target.
+        Alternatively, a function returning the gradient at a point, which is
+        evaluated once for each distinct row of `sample`, using `n_jobs` workers.
+    n_points: int
+        integer specifying the desired number of points.
+    rank: int
+        rank of the approximation, i.e. the number of landmark points.
+    standardize: bool
+        optional logical, either 'True' (default) or 'False', indicating
+        whether or not to standardise the columns of `sample` around means
+        using the mean absolute deviation from the mean as the scale.
+    preconditioner: str
+        optional string, either 'id' (default), 'med', 'sclmed', 'smpcov',
+        'smpvar' or 'lowrank' (see `make_precon`), specifying the
+        preconditioner to be used. Alternatively, a numeric string can be
+        passed as the single length-scale parameter of an isotropic kernel.
+    block_size: Optional[int]
+        if provided, at most `block_size` rows of a column are evaluated at once.
+    n_jobs: Optional[int]
+        number of threads used in the greedy search. Default: 1.
+    dtype: Any
+        floating-point type used to evaluate the kernel. By default, the type of
+        the arrays is used.
+
+    Returns
+    -------
+    Tuple[np.ndarray, float]
+        array shaped (m,) containing the row indices in `sample` (and `gradient`) of the
+        selected points, and the KSD of these points under the exact Stein kernel.
+    """
+    integrand = _make_stein_integrand(
+        sample=sample,
+        gradient=gradient,
+        standardize=standardize,
+        preconditioner=preconditioner,
+        dtype=dtype,
+        n_jobs=n_jobs,
+    )
+    idx = _greedy_search(n_points, NystromKernelPlan(integrand, rank), block_size=block_size, n_jobs=n_jobs)
+    return idx, _selection_ksd(integrand, idx)
+
+
+def thin_wendland(
+        sample: ArrayOrPathT,
+        gradient: GradientT,
+        n_points: int,
+        standardize: bool = True,
+        preconditioner: str = 'id',
+        ell: Optional[int] = None,
+        dtype: Any = None,
+) -> np.ndarray:
+    """Optimally select m points from n > m samples using a compactly supported Stein kernel
+
+    The Stein kernel is based on a Wendland kernel (see `kernel.vfk0_wendland`),
+    which vanishes for points further than 1 apart in the metric of the
+    preconditioner. A KD-tree over the sample is built once, and each step of
+    the greedy search only evaluates the kernel for the points within the
+    support around the selected point. For a well spread sample and a support
+    containing a small fraction of the points, a step costs O(neighbours)
+    rather than O(n) operations. The preconditioner controls the size of the
+    support, e.g. a numeric string gives a support of radius equal to its
+    square root.
+
+    Parameters
+    ----------
+    sample: np.ndarray | str | os.PathLike
+        n x d array where each row is a sample point.
+    gradient: np.ndarray | str | os.PathLike | Callable
+        n x d array where each row is a gradient of the log target.
+        Alternatively, a function returning the gradient at a point, which is
+        evaluated once for each distinct row of `sample`.
+    n_points: int
+        integer specifying the desired number of points.
+    standardize: bool
+        optional logical, either 'True' (default) or 'False', indicating
+        whether or not to standardise the columns of `sample` around means
+        using the mean absolute deviation from the mean as the scale.
+    preconditioner: str
+        optional string, either 'id' (default), 'med', 'sclmed', 'smpcov',
+        'smpvar' or 'lowrank' (see `make_precon`), specifying the
+        preconditioner to be used. Alternatively, a numeric string can be
+        passed as the single length-scale parameter of an isotropic kernel.
+    ell: Optional[int]
+        exponent parameter of the Wendland function. Default: d // 2 + 2.
+    dtype: Any
+        floating-point type used to evaluate the kernel. By default, the type of
+        the arrays is used.
+
+    Returns
+    -------
+    np.ndarray
+        array shaped (m,) containing the row indices in `sample` (and `gradient`) of the
+        selected points.
+    """
+    sample = _load_array(sample, dtype)
+    gradient = _load_gradient(sample, gradient, dtype)
+    scale = _validate_and_standardize(sample, gradient, standardize)
+    linv = make_precon(sample, preconditioner, scale=scale, structured=True)
+    return _greedy_search_sparse(n_points, WendlandKernelPlan(sample, gradient, linv, ell=ell, scale=scale))
 
 
 def thin_gf(
-        sample: np.ndarray,
-        log_p: np.ndarray,
-        log_q: np.ndarray,
-        gradient_q: np.ndarray,
+        sample: ArrayOrPathT,
+        log_p: ArrayOrPathT,
+        log_q: ArrayOrPathT,
+        gradient_q: ArrayOrPathT,
         n_points: int,
         standardize: bool = True,
         preconditioner: str = 'id',
         range_cap: Optional[float] = None,
-) -> np.ndarray:
+        block_size: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        cache: Optional[ColumnCache] = None,
+        dtype: Any = None,
+        backend: str = 'thread',
+        callback: Optional[Callable[[ThinningProgress], None]] = None,
+        callback_interval: int = 1,
+        profile: Optional[ThinningProfile] = None,
+        target_ksd: Optional[float] = None,
+        rtol: Optional[float] = None,
+        return_ksd: bool = False,
+) -> np.ndarray | Tuple[np.ndarray, np.ndarray]:
     """Optimally select m points from n > m samples generated from a target distribution of d dimensions.
 
     This function is based on the gradient-free kernel Stein discrepancy,
@@ -199,17 +1628,20 @@ def thin_gf(
     This is useful when the gradient of the target distribution is difficult to obtain,
     so instead the gradient of the proxy distribution is used.
 
+    The arrays can be passed as paths to .npy files, which are memory-mapped.
+    Memory-mapped arrays are only read in chunks and are never copied as a whole.
+
     Parameters
     ----------
-    sample: np.ndarray
+    sample: np.ndarray | str | os.PathLike
         n x d array where each row is a sample point.
-    log_p: np.ndarray
+    log_p: np.ndarray | str | os.PathLike
         n x 1 array of log-pdf values for the target distribution corresponding
         to points in `sample`.
-    log_q: np.ndarray
+    log_q: np.ndarray | str | os.PathLike
         n x 1 array of log-pdf values for the proxy distribution corresponding
         to points in `sample`.
-    gradient_q: np.ndarray
+    gradient_q: np.ndarray | str | os.PathLike
         n x d array of gradient of the proxy distribution corresponding to points
         in `sample`.
     n_points: int
@@ -219,19 +1651,68 @@ def thin_gf(
         whether or not to standardise the columns of `sample` around means
         using the mean absolute deviation from the mean as the scale.
     preconditioner: str
-        optional string, either 'id' (default), 'med', 'sclmed', or
-        'smpcov', specifying the preconditioner to be used. Alternatively,
-        a numeric string can be passed as the single length-scale parameter
-        of an isotropic kernel.
+        optional string, either 'id' (default), 'med', 'sclmed', 'smpcov',
+        'smpvar' or 'lowrank' (see `make_precon`), specifying the
+        preconditioner to be used. Alternatively, a numeric string can be
+        passed as the single length-scale parameter of an isotropic kernel.
     range_cap: Optional[float]
         if provided, the values of `log_q - log_p` will be clipped above, so that
         the resulting range is at most `range_cap`
+    block_size: Optional[int]
+        if provided, the kernel is evaluated for at most `block_size` points at
+        a time, which bounds the memory used by temporary arrays. By default,
+        the block size only depends on the dimension: blocks have at most
+        `MAX_BLOCK_ROWS` rows, and their temporary arrays hold at most
+        `CHUNK_ELEMENTS` elements.
+    n_jobs: Optional[int]
+        number of threads (or processes, see `backend`) used to evaluate the
+        kernel and search for the next point. Blocks are distributed between
+        the workers, and the result is identical to that of a single worker
+        for the same `block_size`, including the default. Default: 1.
+    cache: Optional[ColumnCache]
+        if provided, kernel columns of selected points are cached and reused
+        when a point is selected more than once.
+    dtype: Any
+        floating-point type used to evaluate the kernel. Arrays of a different
+        type are converted block by block as the kernel is evaluated, so
+        memory-mapped arrays are still not copied. Passing np.float32 halves
+        the arithmetic cost of kernel evaluation, while the running sums used
+        to select points are still accumulated in double precision. By
+        default, the type of the arrays is used.
+    backend: str
+        either 'thread' (default) or 'process'. With 'process', `n_jobs` worker
+        processes share the sample and the running sums through shared memory,
+        which avoids contention for the interpreter lock when n is very large.
+        The selection is the same as with threads. The sample is copied to
+        shared memory once, and `cache` is not supported.
+    callback: Optional[Callable[[ThinningProgress], None]]
+        if provided, function called with a `ThinningProgress` every
+        `callback_interval` steps of the greedy search and after the last step,
+        reporting the elapsed time split into kernel evaluation and search.
+    callback_interval: int
+        number of steps between calls of `callback`. Default: 1.
+    profile: Optional[ThinningProfile]
+        if provided, filled in with the time spent in each phase, the number of
+        kernel columns evaluated and the memory allocated by the greedy search.
+    target_ksd: Optional[float]
+        if provided, the search stops as soon as the KSD of the selected points
+        is at most this value, so that `n_points` is a maximum.
+    rtol: Optional[float]
+        if provided, the search stops at the first point that does not reduce
+        the smallest KSD of the selection so far by at least this fraction,
+        which is not selected.
+    return_ksd: bool
+        whether to also return the KSD of the first i selected points for each
+        i. The values are obtained from the running sums of the greedy search,
+        without evaluating the kernel again. Default: False.
 
     Returns
     -------
-    np.ndarray
+    np.ndarray | Tuple[np.ndarray, np.ndarray]
         array shaped (m,) containing the row indices in `sample` (and `gradient`) of the
-        selected points.
+        selected points, where m is at most `n_points` if the search is stopped early,
+        and, if `return_ksd` is True, array shaped (m,) containing the KSD of each
+        initial part of the selection.
     """
     integrand = _make_stein_gf_integrand(
         sample=sample,
@@ -241,5 +1722,232 @@ def thin_gf(
         standardize=standardize,
         preconditioner=preconditioner,
         range_cap=range_cap,
+        dtype=dtype,
+    )
+    trace = _KsdTrace(target_ksd, rtol)
+    idx = _greedy_search(
+        n_points, integrand, block_size=block_size, n_jobs=n_jobs, cache=cache, backend=backend,
+        callback=callback, callback_interval=callback_interval, profile=profile, trace=trace,
     )
-    return _greedy_search(n_points, integrand)
+    return (idx, np.array(trace.values)) if return_ksd else idx
+
+
+class _RunningMoments:
+    """Sample statistics updated one chunk at a time
+
+    The mean and covariance are merged exactly across chunks. The mean absolute
+    deviation used for standardisation is accumulated using the mean known at
+    the time each chunk is added, so it only approximates the value computed
+    from the full sample.
+    """
+
+    def __init__(self, d: int):
+        self.n = 0
+        self.mean = np.zeros(d)
+        self.m2 = np.zeros((d, d))
+        self.sad = np.zeros(d)
+
+    def update(self, sample: np.ndarray):
+        n = sample.shape[0]
+        mean = np.mean(sample, axis=0)
+        centred = sample - mean
+        delta = mean - self.mean
+        total = self.n + n
+        self.m2 += np.dot(centred.T, centred) + np.outer(delta, delta) * self.n * n / total
+        self.mean += delta * n / total
+        self.n = total
+        self.sad += np.sum(np.abs(sample - self.mean), axis=0)
+
+    def scale(self) -> np.ndarray:
+        return self.sad / self.n
+
+    def covariance(self) -> np.ndarray:
+        return self.m2 / (self.n - 1)
+
+
+def thin_stream(
+        chunks: Iterable[Tuple[np.ndarray, np.ndarray]],
+        n_points: int,
+        standardize: bool = True,
+        preconditioner: str = 'id',
+        block_size: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+) -> Iterator[np.ndarray]:
+    """Apply Stein thinning to a sample arriving in chunks
+
+    After each chunk, the greedy search is run over the distinct points
+    selected so far together with the points in the new chunk, so memory
+    use is bounded by the chunk size and `n_points` rather than by the
+    length of the chain. Since the Stein discrepancy is measured against
+    the target through the gradients, points from earlier chunks need not
+    be retained to represent the target.
+
+    Standardisation statistics and the 'smpcov' and 'smpvar' preconditioners
+    are updated incrementally over all chunks seen. The 'med' and 'sclmed'
+    preconditioners are computed on the points entering each greedy search.
+    The result can therefore differ from thinning the full sample with
+    `thin`. The 'lowrank' preconditioner is not supported, since its
+    principal components would only be estimated from the points entering
+    each search.
+
+    Parameters
+    ----------
+    chunks: Iterable[Tuple[np.ndarray, np.ndarray]]
+        iterable of pairs of arrays, each containing consecutive rows of the
+        sample and of the corresponding gradients of the log target.
+    n_points: int
+        integer specifying the desired number of points.
+    standardize: bool
+        optional logical, either 'True' (default) or 'False', indicating
+        whether or not to standardise the columns of the sample around means
+        using the mean absolute deviation from the mean as the scale.
+    preconditioner: str
+        optional string, either 'id' (default), 'med', 'sclmed', 'smpcov' or
+        'smpvar' (see `make_precon`), specifying the preconditioner to be
+        used. Alternatively, a numeric string can be passed as the single
+        length-scale parameter of an isotropic kernel.
+    block_size: Optional[int]
+        if provided, the kernel is evaluated for at most `block_size` points at
+        a time, which bounds the memory used by temporary arrays.
+    n_jobs: Optional[int]
+        number of threads used to evaluate the kernel and search for the next
+        point. Default: 1.
+
+    Yields
+    ------
+    np.ndarray
+        array shaped (m,) containing the row indices of the points selected
+        from all chunks received so far, counting rows from the start of the
+        first chunk.
+    """
+    assert preconditioner.split(':')[0] != 'lowrank', 'thin_stream does not support the lowrank preconditioner.'
+    moments = None
+    offset = 0
+    for chunk_sample, chunk_gradient in chunks:
+        _validate_and_standardize(chunk_sample, chunk_gradient, standardize=False)
+        n, d = chunk_sample.shape
+        if moments is None:
+            moments = _RunningMoments(d)
+            pool_sample = np.empty((0, d))
+            pool_gradient = np.empty((0, d))
+            pool_index = np.empty(0, dtype=np.int64)
+        moments.update(chunk_sample)
+
+        # Candidates are the distinct points retained so far and the new chunk
+        sample = np.concatenate([pool_sample, chunk_sample])
+        gradient = np.concatenate([pool_gradient, chunk_gradient])
+        index = np.concatenate([pool_index, offset + np.arange(n)])
+        offset += n
+
+        # Standardisation
+        scl = None
+        if standardize:
+            scl = moments.scale()
+            assert np.min(scl) > 0, 'Too few unique samples in smp.'
+
+        # Preconditioner, from the moments of all chunks for 'smpcov' and 'smpvar'
+        if preconditioner in ('smpcov', 'smpvar'):
+            c = moments.covariance()
+            if scl is not None:
+                c /= np.outer(scl, scl)
+            if preconditioner == 'smpcov':
+                linv = _cholesky_precision(c)
+            else:
+                assert np.all(np.diag(c) > 0), 'Too few unique samples.'
+                linv = DiagonalPreconditioner(1 / np.diag(c))
+        else:
+            linv = make_precon(sample, preconditioner, scale=scl, structured=True)
+
+        plan = ImqKernelPlan(sample, gradient, linv, scale=scl)
+        idx = _greedy_search(n_points, plan, block_size=block_size, n_jobs=n_jobs)
+        yield index[idx]
+
+        keep = np.unique(idx)
+        pool_sample = sample[keep]
+        pool_gradient = gradient[keep]
+        pool_index = index[keep]
+
+
+def _greedy_search_batch(n_points: int, plan: ImqBatchKernelPlan) -> np.ndarray:
+    """Run greedy searches for a stack of samples in lockstep
+
+    Parameters
+    ----------
+    n_points: int
+        number of points to select from each sample.
+    plan: ImqBatchKernelPlan
+        kernel plan for the stack of samples.
+
+    Returns
+    -------
+    np.ndarray
+        B x n_points array of indices of selected points in each sample
+    """
+    diagonal = plan.diagonal()
+    idx = np.empty((diagonal.shape[0], n_points), dtype=np.uint32)
+
+    # Array for the running sums
+    k0 = diagonal.astype(np.float64)
+
+    idx[:, 0] = np.argmin(k0, axis=1)
+    for i in range(1, n_points):
+        k0 += 2 * plan.column(idx[:, i - 1])
+        idx[:, i] = np.argmin(k0, axis=1)
+
+    return idx
+
+
+def thin_batch(
+        sample: np.ndarray,
+        gradient: np.ndarray,
+        n_points: int,
+        standardize: bool = True,
+        preconditioner: str = 'id',
+        dtype: Any = None,
+) -> np.ndarray:
+    """Apply Stein thinning to a stack of independent samples
+
+    This is equivalent to calling `thin` for each sample, but the greedy
+    searches run in lockstep, so each step evaluates the kernel for all
+    samples at once. Each sample is standardised and preconditioned
+    separately.
+
+    Parameters
+    ----------
+    sample: np.ndarray
+        B x n x d array containing B samples, each with n points in d dimensions.
+    gradient: np.ndarray
+        B x n x d array where each row is a gradient of the log target at the
+        corresponding point in `sample`.
+    n_points: int
+        integer specifying the desired number of points from each sample.
+    standardize: bool
+        optional logical, either 'True' (default) or 'False', indicating
+        whether or not to standardise the columns of each sample around means
+        using the mean absolute deviation from the mean as the scale.
+    preconditioner: str
+        optional string, either 'id' (default), 'med', 'sclmed', 'smpcov',
+        'smpvar' or 'lowrank' (see `make_precon`), specifying the
+        preconditioner to be used. Alternatively, a numeric string can be
+        passed as the single length-scale parameter of an isotropic kernel.
+    dtype: Any
+        floating-point type used to evaluate the kernel. By default, the type
+        of the arrays is used.
+
+    Returns
+    -------
+    np.ndarray
+        array shaped (B, m) containing the row indices of the selected points
+        in each sample.
+    """
+    sample = np.asarray(sample, dtype=dtype)
+    gradient = np.asarray(gradient, dtype=dtype)
+    assert sample.ndim == 3, 'sample is not three-dimensional.'
+    assert gradient.shape == sample.shape, f'Dimensions of sample {sample.shape} and gradient {gradient.shape} are inconsistent.'
+
+    scales = [_validate_and_standardize(sample[b], gradient[b], standardize) for b in range(sample.shape[0])]
+    linv = np.stack([
+        make_precon(sample[b], preconditioner, scale=scales[b]) for b in range(sample.shape[0])
+    ])
+    plan = ImqBatchKernelPlan(sample, gradient, linv, scale=np.stack(scales) if standardize else None)
+    return _greedy_search_batch(n_points, plan)
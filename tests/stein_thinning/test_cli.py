@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from stein_thinning.cli import main, read_text
+from stein_thinning.thinning import thin, thin_gf
+
+
+def test_read_text(demo_data_dir, demo_smp, tmp_path, monkeypatch):
+    monkeypatch.setattr('stein_thinning.cli.CSV_CHUNK_LINES', 64)
+    np.testing.assert_array_equal(read_text(demo_data_dir / 'smp.csv'), demo_smp)
+
+    arr = read_text(demo_data_dir / 'smp.csv', convert_dir=tmp_path)
+    np.testing.assert_array_equal(arr, demo_smp)
+    np.testing.assert_array_equal(np.load(tmp_path / 'smp.npy'), demo_smp)
+
+    path = tmp_path / 'column.txt'
+    path.write_text('value\n1.5\n2.5\n\n3.5')
+    np.testing.assert_array_equal(read_text(path, skip_header=1), [1.5, 2.5, 3.5])
+
+    # no trailing newline, and blank lines which are not written to the converted file
+    for text in ['1,2\n3,4\n5,6', '1,2\n\n\n3,4\n5,6\n']:
+        path = tmp_path / 'rows.csv'
+        path.write_text(text)
+        expected = [[1., 2.], [3., 4.], [5., 6.]]
+        np.testing.assert_array_equal(read_text(path), expected)
+        np.testing.assert_array_equal(read_text(path, convert_dir=tmp_path), expected)
+        np.testing.assert_array_equal(np.load(tmp_path / 'rows.npy'), expected)
+
+
+def test_main(demo_data_dir, demo_smp, demo_scr, tmp_path, capsys):
+    expected, expected_ksd = thin(demo_smp, demo_scr, 20, return_ksd=True)
+
+    # Text input, indices to standard output
+    assert main([str(demo_data_dir / 'smp.csv'), '20', '--gradient', str(demo_data_dir / 'scr.csv')]) == 0
+    np.testing.assert_array_equal(np.array(capsys.readouterr().out.split(), dtype=int), expected)
+
+    # Binary input and output
+    np.save(tmp_path / 'smp.npy', demo_smp)
+    np.savez(tmp_path / 'scr.npz', gradient=demo_scr)
+    main([
+        str(tmp_path / 'smp.npy'), '20', '--gradient', str(tmp_path / 'scr.npz'),
+        '--threads', '2', '-o', str(tmp_path / 'idx.npy'), '--ksd-output', str(tmp_path / 'ksd.txt'),
+    ])
+    np.testing.assert_array_equal(np.load(tmp_path / 'idx.npy'), expected)
+    np.testing.assert_allclose(np.loadtxt(tmp_path / 'ksd.txt'), expected_ksd, rtol=1e-9)
+
+    # A single archive holding both arrays, which are selected by name
+    chain = str(tmp_path / 'chain.npz')
+    np.savez(chain, sample=demo_smp, gradient=demo_scr)
+    main([chain + ':sample', '20', '--gradient', chain + ':gradient', '-o', str(tmp_path / 'idx.npy')])
+    np.testing.assert_array_equal(np.load(tmp_path / 'idx.npy'), expected)
+    for argv in [[chain, '20', '--gradient', chain + ':gradient'], [chain + ':sample', '20', '--gradient', chain + ':grad']]:
+        with pytest.raises(SystemExit):
+            main(argv)
+    capsys.readouterr()
+
+    # Gradient-free thinning
+    log_p = np.zeros(demo_smp.shape[0])
+    log_q = np.linspace(0, 1, demo_smp.shape[0])
+    np.savetxt(tmp_path / 'log_p.csv', log_p)
+    np.savetxt(tmp_path / 'log_q.csv', log_q)
+    main([
+        str(tmp_path / 'smp.npy'), '20', '--log-p', str(tmp_path / 'log_p.csv'), '--log-q', str(tmp_path / 'log_q.csv'),
+        '--gradient-q', str(demo_data_dir / 'scr.csv'), '--range-cap', '0.5', '-o', str(tmp_path / 'idx.txt'),
+    ])
+    expected = thin_gf(demo_smp, log_p, log_q, demo_scr, 20, range_cap=0.5)
+    np.testing.assert_array_equal(np.loadtxt(tmp_path / 'idx.txt', dtype=int), expected)
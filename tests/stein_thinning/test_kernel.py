@@ -1,7 +1,20 @@
 import numpy as np
 import pytest
 
-from stein_thinning.kernel import make_precon, vfk0_imq
+from stein_thinning.kernel import (
+    CholeskyPreconditioner,
+    DiagonalPreconditioner,
+    ImqKernelPlan,
+    LowRankPreconditioner,
+    PairwiseKernelPlan,
+    ScalarPreconditioner,
+    WendlandKernelPlan,
+    make_imq,
+    make_imq_plan,
+    make_precon,
+    vfk0_imq,
+    vfk0_wendland,
+)
 
 
 def test_make_precon():
@@ -32,9 +45,171 @@ def test_make_precon():
         precon = make_precon(sample, 'foo')
 
 
+def test_structured_precon():
+    rng = np.random.default_rng(12345)
+    n, d = 200, 6
+    x = rng.normal(size=(n, d)) @ rng.normal(size=(d, d)) + 1
+    scale = rng.uniform(0.5, 2, size=d)
+    a = rng.normal(size=(d, 2))
+    for precon in [
+        ScalarPreconditioner(0.5, d),
+        DiagonalPreconditioner(rng.uniform(1, 2, size=d)),
+        CholeskyPreconditioner(np.linalg.cholesky(a @ a.T + np.identity(d))),
+        LowRankPreconditioner(rng.uniform(1, 2, size=d), a, np.array([0.5, 0.25])),
+    ]:
+        dense = precon.dense()
+        np.testing.assert_allclose(precon.dot(x), x @ dense)
+        np.testing.assert_allclose(precon.dot(x[0]), dense @ x[0])
+        np.testing.assert_allclose(precon.trace(), np.trace(dense))
+        f = precon.sqrt_dot(x)
+        np.testing.assert_allclose(np.sum((f[0] - f[1]) ** 2), (x[0] - x[1]) @ dense @ (x[0] - x[1]))
+        np.testing.assert_allclose(type(precon)(**precon.state()).dense(), dense)
+
+    for preconditioner in ['id', 'med', 'sclmed', 'smpcov', '2.5']:
+        structured = make_precon(x, preconditioner, scale=scale, structured=True)
+        np.testing.assert_allclose(structured.dense(), make_precon(x, preconditioner, scale=scale))
+    assert isinstance(make_precon(x, 'med', structured=True), ScalarPreconditioner)
+
+    cov = np.cov(x / scale, rowvar=False)
+    np.testing.assert_allclose(make_precon(x, 'smpcov', scale=scale), np.linalg.inv(cov), rtol=1e-6)
+    np.testing.assert_allclose(make_precon(x, 'smpvar', scale=scale), np.diag(1 / np.diag(cov)))
+    # With full rank, the low-rank preconditioner is the inverse covariance up to regularisation
+    np.testing.assert_allclose(make_precon(x, f'lowrank:{d}', scale=scale), np.linalg.inv(cov), rtol=1e-2)
+    precon = make_precon(x, 'lowrank:2', structured=True)
+    assert isinstance(precon, LowRankPreconditioner) and precon.factor.shape == (d, 2)
+    assert np.all(np.linalg.eigvalsh(precon.dense()) > 0)
+    with pytest.raises(AssertionError):
+        make_precon(x, f'lowrank:{d + 1}')
+
+
 def test_vfk0_imq():
     x1 = np.array([1., 2., 3.])
     x2 = np.array([2., 3., 4.])
     s1 = np.array([0.5, 0.75, 1.5])
     s2 = np.array([1., 1.5, 3.])
     np.testing.assert_approx_equal(vfk0_imq(x1, x2, s1, s2, np.identity(3)), 3.5)
+
+
+def test_imq_kernel_plan():
+    rng = np.random.default_rng(12345)
+    n, d = 50, 4
+    x = rng.normal(size=(n, d))
+    s = rng.normal(size=(n, d))
+    a = rng.normal(size=(d, d))
+    linv = a @ a.T + np.identity(d)
+    plan = ImqKernelPlan(x, s, linv, beta=-0.75)
+
+    def expected(ind1, ind2):
+        return vfk0_imq(x[ind1], x[ind2], s[ind1], s[ind2], linv, beta=-0.75)
+
+    np.testing.assert_allclose(plan.diagonal(), expected(slice(None), slice(None)))
+    np.testing.assert_allclose(plan.column(7), expected(slice(None), [7]))
+    np.testing.assert_allclose(plan.column(7, slice(10, 20)), expected(slice(10, 20), [7]))
+    ind1, ind2 = np.triu_indices(n)
+    np.testing.assert_allclose(plan(ind1, ind2), expected(ind1, ind2))
+    np.testing.assert_allclose(plan([3], slice(0, 4)), expected([3], slice(0, 4)))
+
+
+def test_imq_kernel_plan_structured(demo_smp, demo_scr):
+    for preconditioner in ['med', 'smpcov', 'smpvar', 'lowrank:1']:
+        precon = make_precon(demo_smp, preconditioner, structured=True)
+        plan = ImqKernelPlan(demo_smp, demo_scr, precon)
+        expected = ImqKernelPlan(demo_smp, demo_scr, precon.dense())
+        np.testing.assert_allclose(plan.diagonal(), expected.diagonal())
+        np.testing.assert_allclose(plan.column(5), expected.column(5), rtol=1e-6)
+        np.testing.assert_allclose(plan.columns(np.array([1, 9])), expected.columns(np.array([1, 9])), rtol=1e-6)
+        np.testing.assert_allclose(
+            plan.column(5), vfk0_imq(demo_smp, demo_smp[[5]], demo_scr, demo_scr[[5]], precon), rtol=1e-6,
+        )
+
+
+def test_imq_kernel_plan_offset():
+    # the kernel is translation invariant, and is evaluated accurately far from the origin
+    rng = np.random.default_rng(12345)
+    n, d = 200, 5
+    x = rng.normal(size=(n, d))
+    s = -x
+    expected = ImqKernelPlan(x, s, np.identity(d))
+    plan = ImqKernelPlan(x + 1000, s, np.identity(d))
+    np.testing.assert_allclose(plan.diagonal(), expected.diagonal())
+    np.testing.assert_allclose(plan.column(7), expected.column(7), rtol=1e-10)
+    np.testing.assert_allclose(plan.columns(np.array([3, 7])), expected.columns(np.array([3, 7])), rtol=1e-10)
+    np.testing.assert_allclose(plan.block(np.arange(n), np.array([7])), expected.block(np.arange(n), np.array([7])), rtol=1e-10)
+    np.testing.assert_allclose(plan([1, 2], [3, 4]), expected([1, 2], [3, 4]), rtol=1e-10)
+
+
+def test_make_imq_plan(demo_smp, demo_scr):
+    plan = make_imq_plan(demo_smp, demo_scr, 'med')
+    vfk0 = make_imq(demo_smp, 'med')
+    np.testing.assert_allclose(plan.column(5), vfk0(demo_smp, demo_smp[[5]], demo_scr, demo_scr[[5]]))
+
+
+def test_imq_kernel_plan_scale():
+    rng = np.random.default_rng(12345)
+    x = rng.normal(size=(30, 3))
+    s = rng.normal(size=(30, 3))
+    scale = np.array([0.5, 2., 3.])
+    plan = ImqKernelPlan(x, s, np.identity(3), scale=scale)
+    expected = ImqKernelPlan(x / scale, s * scale, np.identity(3))
+    np.testing.assert_allclose(plan.diagonal(), expected.diagonal())
+    np.testing.assert_allclose(plan.column(4), expected.column(4))
+    np.testing.assert_allclose(plan([1, 2], [3, 4]), expected([1, 2], [3, 4]))
+    np.testing.assert_allclose(
+        make_precon(x, 'smpcov', scale=scale), make_precon(x / scale, 'smpcov'))
+    np.testing.assert_allclose(make_precon(x, 'med', scale=scale), make_precon(x / scale, 'med'))
+
+
+def test_kernel_plan_block(demo_smp, demo_scr):
+    plan = make_imq_plan(demo_smp, demo_scr, 'sclmed')
+    pairwise = PairwiseKernelPlan(make_imq(demo_smp, 'sclmed'), demo_smp, demo_scr)
+    rows = np.arange(10, 30)
+    cols = np.array([0, 5, 17, 400])
+    expected = np.array([[plan(i, j) for j in cols] for i in rows])
+    np.testing.assert_allclose(plan.block(rows, cols), expected)
+    np.testing.assert_allclose(pairwise.block(rows, cols), expected)
+
+
+def test_vfk0_wendland():
+    rng = np.random.default_rng(12345)
+    d = 3
+    linv = np.array([
+        [2., 0.5, 0.],
+        [0.5, 1., 0.2],
+        [0., 0.2, 1.5],
+    ])
+    x, y, sx, sy = (rng.normal(scale=0.3, size=(1, d)) for _ in range(4))
+
+    # Stein kernel from finite differences of the base kernel
+    a = d // 2 + 3
+    def k(x, y):
+        r = np.sqrt((x - y) @ linv @ (x - y))
+        return max(1 - r, 0) ** a * (a * r + 1)
+    h = 1e-4
+    e = np.identity(d) * h
+    grad_x = np.array([(k(x[0] + e[i], y[0]) - k(x[0] - e[i], y[0])) / (2 * h) for i in range(d)])
+    grad_y = np.array([(k(x[0], y[0] + e[i]) - k(x[0], y[0] - e[i])) / (2 * h) for i in range(d)])
+    div = sum(
+        (k(x[0] + e[i], y[0] + e[i]) - k(x[0] + e[i], y[0] - e[i]) - k(x[0] - e[i], y[0] + e[i]) + k(x[0] - e[i], y[0] - e[i]))
+        / (4 * h ** 2)
+        for i in range(d)
+    )
+    expected = div + grad_x @ sy[0] + grad_y @ sx[0] + k(x[0], y[0]) * sx[0] @ sy[0]
+    np.testing.assert_allclose(vfk0_wendland(x, y, sx, sy, linv), expected, rtol=1e-5)
+
+    # The kernel vanishes outside of its support
+    assert vfk0_wendland(x, x + 2, sx, sy, linv) == 0
+
+
+def test_wendland_kernel_plan(demo_smp, demo_scr):
+    linv = np.identity(2) / 0.5
+    plan = WendlandKernelPlan(demo_smp, demo_scr, linv)
+    ind = np.arange(plan.n)
+    np.testing.assert_allclose(plan.diagonal(), vfk0_wendland(demo_smp, demo_smp, demo_scr, demo_scr, linv))
+
+    j = 68
+    column = vfk0_wendland(demo_smp, demo_smp[[j]], demo_scr, demo_scr[[j]], linv)
+    rows, values = plan.sparse_column(j)
+    assert len(rows) < plan.n
+    np.testing.assert_allclose(values, column[rows])
+    np.testing.assert_array_equal(np.delete(column, rows), 0)
+    np.testing.assert_allclose(plan(ind, np.full(plan.n, j)), column)
@@ -1,6 +1,7 @@
 import numpy as np
 
-from stein_thinning.stein import kmat, ksd
+from stein_thinning.kernel import make_imq
+from stein_thinning.stein import kmat, ksd, optimal_weights, weighted_ksd
 from stein_thinning.thinning import _make_stein_integrand
 
 
@@ -31,3 +32,79 @@ def test_demo_kmat(demo_smp, demo_scr, demo_kmat):
     integrand = _make_stein_integrand(demo_smp, demo_scr, standardize=False)
     result = kmat(integrand, demo_smp.shape[0])
     np.testing.assert_array_almost_equal(result, demo_kmat)
+
+
+def test_ksd_blocks(demo_smp, demo_scr):
+    def ksd_loop(integrand, n):
+        cum_sum = np.zeros(n)
+        cum_sum[0] = integrand(0, 0)
+        for i in range(1, n):
+            vals = integrand([i], slice(0, i + 1))
+            cum_sum[i] = cum_sum[i - 1] + 2 * np.sum(vals) - vals[-1]
+        return np.sqrt(cum_sum) / np.arange(1, n + 1)
+
+    n = 300
+    for integrand in [
+        _make_stein_integrand(demo_smp, demo_scr),
+        _make_stein_integrand(demo_smp, demo_scr, vfk0=make_imq(demo_smp, 'med')),
+    ]:
+        expected = ksd_loop(integrand, n)
+        for block_size in [3, 64, 1000]:
+            np.testing.assert_allclose(ksd(integrand, n, block_size=block_size), expected)
+
+    checkpoints = np.geomspace(1, n, 10).astype(int) - 1
+    np.testing.assert_allclose(ksd(integrand, n, checkpoints=checkpoints), expected[checkpoints])
+    np.testing.assert_allclose(ksd(integrand, n, checkpoints=[5, 2]), expected[[5, 2]])
+
+
+def test_kmat_blocks(demo_smp, demo_scr, tmp_path):
+    n = 100
+    integrand = _make_stein_integrand(demo_smp[:n], demo_scr[:n])
+    ind1, ind2 = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    expected = integrand(ind1.ravel(), ind2.ravel()).reshape(n, n)
+    for block_size in [1, 7, 64, 1000]:
+        np.testing.assert_allclose(kmat(integrand, n, block_size=block_size), expected)
+
+    result = kmat(integrand, n, block_size=16, dtype=np.float32)
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    out = np.lib.format.open_memmap(tmp_path / 'kmat.npy', mode='w+', dtype=np.float64, shape=(n, n))
+    result = kmat(integrand, n, block_size=16, out=out)
+    assert result is out
+    out.flush()
+    np.testing.assert_allclose(np.load(tmp_path / 'kmat.npy'), expected)
+
+
+def test_weighted_ksd(demo_smp, demo_scr):
+    n = 100
+    integrand = _make_stein_integrand(demo_smp[:n], demo_scr[:n])
+    weights = np.random.default_rng(12345).random(n)
+    mat = kmat(integrand, n)
+    expected = np.sqrt(weights @ mat @ weights) / np.sum(weights)
+    for block_size in [1, 7, 64, 1000]:
+        np.testing.assert_allclose(weighted_ksd(integrand, weights, block_size=block_size), expected)
+    np.testing.assert_allclose(weighted_ksd(integrand, np.ones(n)), ksd(integrand, n)[-1])
+
+
+def test_optimal_weights(demo_smp, demo_scr):
+    n = 40
+    integrand = _make_stein_integrand(demo_smp[::10][:n], demo_scr[::10][:n])
+    mat = kmat(integrand, n)
+    uniform = np.sqrt(np.mean(mat))
+
+    weights, value = optimal_weights(integrand, n, tol=1e-10, max_iter=10000, block_size=16)
+    assert np.all(weights >= 0)
+    np.testing.assert_allclose(np.sum(weights), 1)
+    np.testing.assert_allclose(value, np.sqrt(weights @ mat @ weights))
+    assert value < uniform
+
+    # Optimality conditions: the gradient is smallest, and equal, on the support
+    grad = mat @ weights
+    support = weights > 1e-12
+    np.testing.assert_allclose(grad[support], value ** 2, rtol=1e-6)
+    assert np.all(grad >= value ** 2 * (1 - 1e-6))
+
+    # Precomputed matrix and warm start
+    _, dense_value = optimal_weights(mat, n, weights=np.arange(n) % 3, tol=1e-10, max_iter=10000)
+    np.testing.assert_allclose(dense_value, value, rtol=1e-8)
@@ -1,8 +1,29 @@
+import warnings
+
 import numpy as np
+import pytest
 from scipy.stats import multivariate_normal as mvn
 
-from stein_thinning.kernel import vfk0_imq, make_precon
-from stein_thinning.thinning import thin, thin_gf, _make_stein_integrand, _greedy_search
+from stein_thinning.kernel import CHUNK_ELEMENTS, vfk0_imq, make_precon, make_wendland
+from stein_thinning.stein import ksd, weighted_ksd
+from stein_thinning.thinning import (
+    ColumnCache,
+    SteinThinner,
+    ThinningProfile,
+    selection_ksd,
+    selection_weights,
+    thin,
+    thin_batch,
+    thin_gf,
+    thin_nystrom,
+    thin_stream,
+    thin_wendland,
+    _default_block_size,
+    _make_stein_integrand,
+    _greedy_search,
+    _unique_rows,
+    _greedy_search_multi,
+)
 
 
 def test_thin(demo_smp, demo_scr):
@@ -73,3 +94,448 @@ def test_thin_gf():
     expected = np.array([302, 995, 914, 931, 889, 918, 65, 714, 885, 46, 601, 88, 111,
         16, 478, 462, 750, 79, 783, 739])
     np.testing.assert_array_equal(idx3, expected)
+
+
+def test_thin_block_size(demo_smp, demo_scr):
+    idx = thin(demo_smp, demo_scr, 40)
+    for block_size in [1, 37, 500, 1000]:
+        np.testing.assert_array_equal(thin(demo_smp, demo_scr, 40, block_size=block_size), idx)
+
+    log_p = np.zeros(demo_smp.shape[0])
+    log_q = np.linspace(0., 1., demo_smp.shape[0])
+    idx = thin_gf(demo_smp, log_p, log_q, demo_scr, 40)
+    np.testing.assert_array_equal(thin_gf(demo_smp, log_p, log_q, demo_scr, 40, block_size=37), idx)
+
+
+def test_thin_n_jobs(demo_smp, demo_scr):
+    idx = thin(demo_smp, demo_scr, 40)
+    for n_jobs in [2, 3, 8]:
+        np.testing.assert_array_equal(thin(demo_smp, demo_scr, 40, n_jobs=n_jobs), idx)
+        np.testing.assert_array_equal(thin(demo_smp, demo_scr, 40, block_size=37, n_jobs=n_jobs), idx)
+
+    # a sample split into several blocks by default, in low and high dimension
+    rng = np.random.default_rng(3)
+    for n, d in [(20000, 2), (3000, 1000)]:
+        smp = rng.normal(size=(n, d))
+        assert _default_block_size(_make_stein_integrand(smp, -smp)) < n
+        idx = thin(smp, -smp, 5)
+        for n_jobs in [2, 7]:
+            np.testing.assert_array_equal(thin(smp, -smp, 5, n_jobs=n_jobs), idx)
+            np.testing.assert_array_equal(thin(smp, -smp, 5, n_jobs=n_jobs, backend='process'), idx)
+
+
+def test_thin_cache(demo_smp, demo_scr):
+    idx = thin(demo_smp, demo_scr, 40)
+    n_repeated = 39 - len(np.unique(idx[:-1]))
+
+    cache = ColumnCache(max_bytes=10 ** 6)
+    np.testing.assert_array_equal(thin(demo_smp, demo_scr, 40, cache=cache), idx)
+    assert cache.hits == n_repeated
+    assert cache.hits + cache.misses == 39
+
+    # a cache holding a single column
+    cache = ColumnCache(max_bytes=demo_smp.shape[0] * 8)
+    np.testing.assert_array_equal(thin(demo_smp, demo_scr, 40, block_size=37, n_jobs=2, cache=cache), idx)
+    assert len(cache) == 1
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_column_cache():
+    cache = ColumnCache(max_bytes=2 * 8 * 10)
+    for j in range(3):
+        assert cache.get(j) is None
+        cache.put(j, np.full(10, float(j)))
+    assert cache.get(0) is None
+    assert cache.get(2)[0] == 2.
+    cache.put(3, np.zeros(10))
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+    assert (cache.hits, cache.misses) == (2, 5)
+
+
+def test_thin_stream(demo_smp, demo_scr):
+    # a single chunk is equivalent to thinning the full sample
+    results = list(thin_stream([(demo_smp, demo_scr)], 40))
+    assert len(results) == 1
+    np.testing.assert_array_equal(results[0], thin(demo_smp, demo_scr, 40))
+    for preconditioner in ['smpcov', 'smpvar']:
+        results = list(thin_stream([(demo_smp, demo_scr)], 40, preconditioner=preconditioner))
+        np.testing.assert_array_equal(results[0], thin(demo_smp, demo_scr, 40, preconditioner=preconditioner))
+
+    chunks = [(demo_smp[i:i + 100], demo_scr[i:i + 100]) for i in range(0, demo_smp.shape[0], 100)]
+    with pytest.raises(AssertionError):
+        next(thin_stream(iter(chunks), 20, preconditioner='lowrank:1'))
+    for preconditioner in ['id', 'med', 'smpcov', 'smpvar']:
+        results = list(thin_stream(iter(chunks), 20, preconditioner=preconditioner))
+        assert len(results) == len(chunks)
+        for i, idx in enumerate(results):
+            assert idx.shape == (20,)
+            assert np.all(idx < min(100 * (i + 1), demo_smp.shape[0]))
+
+    # the selection from the stream has a similar KSD to that from the full sample
+    integrand = _make_stein_integrand(demo_smp, demo_scr)
+    def final_ksd(idx):
+        return np.sqrt(np.sum(integrand(idx[:, np.newaxis], idx[np.newaxis, :]))) / len(idx)
+    assert final_ksd(results[-1]) < 1.5 * final_ksd(thin(demo_smp, demo_scr, 20, preconditioner='smpcov'))
+
+
+def test_thin_npy(demo_smp, demo_scr, tmp_path):
+    np.save(tmp_path / 'smp.npy', demo_smp)
+    np.save(tmp_path / 'scr.npy', demo_scr)
+    for preconditioner in ['id', 'med', 'smpcov']:
+        idx = thin(tmp_path / 'smp.npy', str(tmp_path / 'scr.npy'), 40, preconditioner=preconditioner)
+        np.testing.assert_array_equal(idx, thin(demo_smp, demo_scr, 40, preconditioner=preconditioner))
+
+    log_p = np.zeros(demo_smp.shape[0])
+    np.save(tmp_path / 'log_p.npy', log_p)
+    idx = thin_gf(tmp_path / 'smp.npy', tmp_path / 'log_p.npy', log_p, tmp_path / 'scr.npy', 40)
+    np.testing.assert_array_equal(idx, thin(demo_smp, demo_scr, 40))
+
+
+def test_thin_float32(demo_smp, demo_scr):
+    # on the demo sample, single precision selects exactly the same points
+    idx = thin(demo_smp, demo_scr, 40, dtype=np.float32)
+    np.testing.assert_array_equal(idx, thin(demo_smp, demo_scr, 40))
+
+    # on a larger sample, the selected points can differ, but only in a way
+    # that has a negligible effect on the KSD of the selected points
+    rng = np.random.default_rng(12345)
+    sample = rng.normal(size=(5000, 10))
+    gradient = -sample
+    integrand = _make_stein_integrand(sample, gradient)
+    def final_ksd(idx):
+        return np.sqrt(np.sum(integrand.block(idx, idx))) / len(idx)
+    idx64 = thin(sample, gradient, 100)
+    idx32 = thin(sample, gradient, 100, dtype=np.float32)
+    np.testing.assert_allclose(final_ksd(idx32), final_ksd(idx64), rtol=1e-3)
+
+    integrand32 = _make_stein_integrand(demo_smp, demo_scr, dtype=np.float32)
+    assert integrand32.dtype == np.float32
+    integrand64 = _make_stein_integrand(demo_smp, demo_scr)
+    np.testing.assert_allclose(ksd(integrand32, 100), ksd(integrand64, 100), rtol=1e-5)
+
+    # a sample far from the origin relative to its spread, passed in double
+    # and in single precision
+    sample = rng.normal(size=(5000, 3))
+    expected = thin(sample, -sample, 50)
+    for offset in [100, 1000]:
+        shifted = sample + offset
+        np.testing.assert_array_equal(thin(shifted, -sample, 50, dtype=np.float32), expected)
+        idx32 = thin(shifted.astype(np.float32), (-sample).astype(np.float32), 50)
+        assert np.mean(idx32 == expected) > 0.9
+        column = _make_stein_integrand(shifted, -sample, dtype=np.float32).column(7)
+        np.testing.assert_allclose(column, _make_stein_integrand(sample, -sample).column(7), rtol=1e-4, atol=1e-6)
+
+
+def test_thin_batch(demo_smp, demo_scr):
+    rng = np.random.default_rng(12345)
+    n = 200
+    sample = np.stack([demo_smp[:n], demo_smp[-n:], rng.normal(size=(n, 2))])
+    gradient = np.stack([demo_scr[:n], demo_scr[-n:], -sample[2]])
+    for standardize in [True, False]:
+        for preconditioner in ['id', 'sclmed', 'smpcov']:
+            idx = thin_batch(sample, gradient, 20, standardize=standardize, preconditioner=preconditioner)
+            assert idx.shape == (3, 20)
+            for b in range(3):
+                expected = thin(sample[b], gradient[b], 20, standardize=standardize, preconditioner=preconditioner)
+                np.testing.assert_array_equal(idx[b], expected)
+
+
+def test_thin_process_backend(demo_smp, demo_scr):
+    idx = thin(demo_smp, demo_scr, 40)
+    np.testing.assert_array_equal(thin(demo_smp, demo_scr, 40, n_jobs=3, backend='process'), idx)
+    np.testing.assert_array_equal(
+        thin(demo_smp, demo_scr, 40, block_size=37, n_jobs=2, backend='process', dtype=np.float32), idx)
+
+    log_p = np.zeros(demo_smp.shape[0])
+    log_q = np.linspace(0., 1., demo_smp.shape[0])
+    np.testing.assert_array_equal(
+        thin_gf(demo_smp, log_p, log_q, demo_scr, 40, n_jobs=2, backend='process'),
+        thin_gf(demo_smp, log_p, log_q, demo_scr, 40),
+    )
+
+    with pytest.raises(ValueError):
+        thin(demo_smp, demo_scr, 40, backend='foo')
+
+
+def test_thin_nystrom(demo_smp, demo_scr):
+    integrand = _make_stein_integrand(demo_smp, demo_scr)
+    def final_ksd(idx):
+        return np.sqrt(np.sum(integrand.block(idx, idx))) / len(idx)
+    exact = final_ksd(thin(demo_smp, demo_scr, 40))
+
+    for rank in [100, 200]:
+        idx, ksd_approx = thin_nystrom(demo_smp, demo_scr, 40, rank)
+        assert idx.shape == (40,)
+        np.testing.assert_allclose(ksd_approx, final_ksd(idx))
+        assert ksd_approx < 1.2 * exact
+
+    # with all points as landmarks, the approximation is exact up to rounding
+    idx, ksd_approx = thin_nystrom(demo_smp, demo_scr, 40, demo_smp.shape[0])
+    np.testing.assert_allclose(ksd_approx, exact, rtol=1e-6)
+
+
+def test_thin_prefilter(demo_smp, demo_scr):
+    integrand = _make_stein_integrand(demo_smp, demo_scr)
+    indices = np.arange(0, demo_smp.shape[0], 3)
+    np.testing.assert_allclose(
+        integrand.subset(indices).block(np.arange(10), np.arange(20)),
+        integrand.block(indices[:10], indices[:20]),
+    )
+
+    expected = thin(demo_smp, demo_scr, 40)
+    for prefilter in ['diagonal', 'grid']:
+        # A pool of all points gives the unfiltered result
+        idx = thin(demo_smp, demo_scr, 40, prefilter=prefilter, n_candidates=demo_smp.shape[0])
+        np.testing.assert_array_equal(idx, expected)
+
+    baseline = selection_ksd(demo_smp, demo_scr, expected)
+    idx = thin(demo_smp, demo_scr, 40, prefilter='grid', n_candidates=200)
+    assert len(np.unique(idx)) <= 200
+    assert selection_ksd(demo_smp, demo_scr, idx) < 1.1 * baseline
+
+    with pytest.raises(ValueError):
+        thin(demo_smp, demo_scr, 40, prefilter='unknown', n_candidates=100)
+
+
+def test_thin_points_per_step(demo_smp, demo_scr):
+    integrand = _make_stein_integrand(demo_smp, demo_scr)
+    cols = np.array([3, 7, 7])
+    np.testing.assert_allclose(integrand.columns(cols, slice(10, 50)), integrand.block(cols, np.arange(10, 50)))
+
+    expected = thin(demo_smp, demo_scr, 40)
+    idx = thin(demo_smp, demo_scr, 40, points_per_step=1)
+    np.testing.assert_array_equal(idx, expected)
+
+    # With all points as candidates, the selection within a step is exact
+    idx = _greedy_search_multi(40, integrand, 5, pool_size=demo_smp.shape[0])
+    np.testing.assert_array_equal(idx, expected)
+
+    # Quality of the selection with the default pool of candidates
+    baseline = selection_ksd(demo_smp, demo_scr, expected)
+    for points_per_step in [2, 5]:
+        idx = thin(demo_smp, demo_scr, 40, points_per_step=points_per_step, block_size=64)
+        assert len(idx) == 40
+        assert selection_ksd(demo_smp, demo_scr, idx) < 1.2 * baseline
+
+    # Default blocks account for the dimension, splitting the sample when d is large
+    smp = np.random.default_rng(4).normal(size=(3000, 200))
+    integrand = _make_stein_integrand(smp, -smp)
+    block_size = _default_block_size(integrand, 5)
+    assert block_size * 5 * integrand.workspace(1).size <= CHUNK_ELEMENTS
+    np.testing.assert_array_equal(
+        _greedy_search_multi(10, integrand, 5), _greedy_search_multi(10, integrand, 5, block_size=smp.shape[0]),
+    )
+
+
+def test_thin_wendland(demo_smp, demo_scr):
+    # The sparse greedy search matches the dense one with the same kernel
+    vfk0 = make_wendland(demo_smp, '0.5')
+    expected = _greedy_search(40, _make_stein_integrand(demo_smp, demo_scr, vfk0=vfk0))
+    idx = thin_wendland(demo_smp, demo_scr, 40, preconditioner='0.5')
+    np.testing.assert_array_equal(idx, expected)
+
+
+def test_stein_thinner(demo_smp, demo_scr, tmp_path):
+    expected = thin(demo_smp, demo_scr, 40)
+    thinner = SteinThinner(demo_smp, demo_scr)
+    np.testing.assert_array_equal(thinner.extend(15), expected[:15])
+    np.testing.assert_array_equal(thinner.extend(5), expected[15:20])
+
+    path = tmp_path / 'state.npz'
+    thinner.save(path)
+    np.testing.assert_array_equal(thinner.extend(20), expected[20:])
+    np.testing.assert_array_equal(thinner.indices, expected)
+
+    thinner = SteinThinner.load(path, demo_smp, demo_scr)
+    np.testing.assert_array_equal(thinner.indices, expected[:20])
+    np.testing.assert_array_equal(thinner.extend(20), expected[20:])
+
+    thinner = SteinThinner.load(path, demo_smp, demo_scr, n_jobs=2, backend='process')
+    np.testing.assert_array_equal(thinner.extend(20), expected[20:])
+
+    expected = thin(demo_smp, demo_scr, 20, preconditioner='lowrank:1')
+    thinner = SteinThinner(demo_smp, demo_scr, preconditioner='lowrank:1')
+    np.testing.assert_array_equal(thinner.extend(10), expected[:10])
+    thinner.save(path)
+    thinner = SteinThinner.load(path, demo_smp, demo_scr)
+    np.testing.assert_array_equal(thinner.extend(10), expected[10:])
+
+
+def test_thin_progress(demo_smp, demo_scr):
+    expected = thin(demo_smp, demo_scr, 40)
+    progress = []
+    profile = ThinningProfile()
+    cache = ColumnCache(2 ** 20)
+    idx = thin(
+        demo_smp, demo_scr, 40, n_jobs=2, cache=cache, callback=progress.append, callback_interval=15, profile=profile,
+    )
+    np.testing.assert_array_equal(idx, expected)
+
+    assert [p.step for p in progress] == [15, 30, 40]
+    assert [p.index for p in progress] == list(expected[[14, 29, 39]])
+    assert all(p.kernel_time > 0 and p.search_time > 0 and p.elapsed > 0 for p in progress)
+    assert all(p.n_points == 40 for p in progress)
+
+    # The objective is the running sum of the selected point
+    integrand = _make_stein_integrand(demo_smp, demo_scr)
+    j = expected[14]
+    objective = integrand.diagonal([j])[0] + 2 * np.sum(integrand.block([j], expected[:14]))
+    np.testing.assert_allclose(progress[0].objective, objective)
+
+    assert profile.steps == 40
+    assert profile.columns == cache.misses
+    assert profile.cached_columns == cache.hits
+    assert profile.columns + profile.cached_columns == 39
+    assert profile.wall_time >= progress[-1].elapsed
+    assert profile.bytes_allocated >= demo_smp.shape[0] * 8 + cache.nbytes
+
+    # Indices are reported in the original sample when the search runs on candidates
+    progress = []
+    idx = thin(demo_smp, demo_scr, 40, prefilter='grid', n_candidates=200, callback=progress.append)
+    assert [p.index for p in progress] == list(idx)
+
+
+def test_thin_ksd_trace(demo_smp, demo_scr):
+    expected = thin(demo_smp, demo_scr, 40)
+    idx, trace = thin(demo_smp, demo_scr, 40, return_ksd=True)
+    np.testing.assert_array_equal(idx, expected)
+    integrand = _make_stein_integrand(demo_smp, demo_scr)
+    np.testing.assert_allclose(trace, ksd(lambda i, j: integrand(idx[i], idx[j]), 40))
+
+    # Early stopping
+    target = trace[24]
+    idx, trace = thin(demo_smp, demo_scr, 40, target_ksd=target, return_ksd=True)
+    m = np.argmax(trace <= target) + 1
+    assert len(idx) == len(trace) == m <= 25
+    np.testing.assert_array_equal(idx, expected[:m])
+
+    # The point that fails the improvement test is not selected
+    full = ksd(lambda i, j: integrand(expected[i], expected[j]), 40)
+    m = np.argmax(full[1:] > 0.99 * np.minimum.accumulate(full)[:-1]) + 1
+    progress = []
+    idx, trace = thin(demo_smp, demo_scr, 40, rtol=0.01, return_ksd=True, callback=progress.append, callback_interval=7)
+    assert len(idx) == len(trace) == m < 40
+    np.testing.assert_array_equal(idx, expected[:m])
+    np.testing.assert_allclose(trace, full[:m])
+    assert progress[-1].step == m and progress[-1].index == idx[-1]
+
+    # A thinner stopped by rtol starts with the rejected point again
+    thinner = SteinThinner(demo_smp, demo_scr)
+    np.testing.assert_array_equal(thinner.extend(40, rtol=0.01), expected[:m])
+    np.testing.assert_array_equal(thinner.extend(40 - m), expected[m:])
+    np.testing.assert_allclose(thinner.ksd, full)
+
+    # A thinner continues the trace
+    thinner = SteinThinner(demo_smp, demo_scr)
+    thinner.extend(10)
+    thinner.extend(30)
+    np.testing.assert_allclose(thinner.ksd, ksd(lambda i, j: integrand(expected[i], expected[j]), 40))
+
+
+def test_thin_gf_weights(demo_smp, demo_scr):
+    n = demo_smp.shape[0]
+    log_p = np.zeros(n)
+    kmat = _make_stein_integrand(demo_smp, demo_scr).block(np.arange(n), np.arange(n))
+    order = np.random.default_rng(12345).permutation(n)
+    for weight_range in [5., 60., 300., 800.]:
+        log_q = np.linspace(0, weight_range, n)[order]
+
+        # Greedy search on the kernel matrix weighted by exp(log_q - log_p),
+        # normalised by the smallest weight, which is selected first
+        w = np.exp(np.minimum(log_q, 300.))
+        with np.errstate(over='ignore', invalid='ignore'):
+            weighted = w[:, np.newaxis] * kmat * w
+        k0 = np.diag(weighted).copy()
+        expected = []
+        for _ in range(20):
+            expected.append(np.argmin(k0))
+            k0 += 2 * weighted[:, expected[-1]]
+        sums = np.array([np.sum(weighted[np.ix_(expected[:i], expected[:i])]) for i in range(1, 21)])
+        expected_ksd = np.sqrt(sums) / np.arange(1, 21)
+
+        for dtype in [np.float64, np.float32]:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)
+                warnings.simplefilter('error', RuntimeWarning)
+                idx, trace = thin_gf(demo_smp, log_p, log_q, demo_scr, 20, return_ksd=True, dtype=dtype)
+            np.testing.assert_array_equal(idx, expected)
+            np.testing.assert_allclose(trace, expected_ksd, rtol=1e-6 if dtype == np.float64 else 1e-4)
+
+            # the search stops at the first point reaching the target
+            target = np.min(expected_ksd) * (1 + 1e-3)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)
+                idx = thin_gf(demo_smp, log_p, log_q, demo_scr, 20, target_ksd=target, dtype=dtype)
+            np.testing.assert_array_equal(idx, expected[:np.argmax(expected_ksd <= target) + 1])
+
+        # a common offset of the log weights changes neither the selection nor the KSD
+        for offset in [-50., 100.]:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)
+                idx, trace = thin_gf(demo_smp, log_p + offset, log_q, demo_scr, 20, return_ksd=True)
+            np.testing.assert_array_equal(idx, expected)
+            np.testing.assert_allclose(trace, expected_ksd, rtol=1e-6)
+
+
+def test_thin_gradient_function(demo_smp, demo_scr):
+    # Chain with repeated rows, as produced by rejected proposals
+    rng = np.random.default_rng(12345)
+    sample = demo_smp[np.sort(rng.integers(0, 100, size=300))]
+    expected = thin(sample, -sample, 20)
+
+    calls = []
+    def gradient(x):
+        calls.append(x)
+        return -x
+    for n_jobs in [None, 3]:
+        calls.clear()
+        np.testing.assert_array_equal(thin(sample, gradient, 20, n_jobs=n_jobs), expected)
+        assert len(calls) == len(np.unique(sample, axis=0))
+
+    idx = thin(sample, np.negative, 20, n_jobs=2, backend='process')
+    np.testing.assert_array_equal(idx, expected)
+
+
+def test_thin_deduplicate(demo_smp, demo_scr):
+    # Metropolis-like chain repeating each point a random number of times
+    rng = np.random.default_rng(12345)
+    repeats = rng.integers(1, 6, size=200)
+    rows = np.repeat(np.arange(200), repeats)
+    sample, gradient = demo_smp[rows], demo_scr[rows]
+
+    first, inverse, counts = _unique_rows(sample, gradient)
+    np.testing.assert_array_equal(sample[first][inverse], sample)
+    np.testing.assert_array_equal(counts, np.bincount(inverse))
+    assert len(first) <= 200
+    assert np.all(np.diff(first) > 0)
+
+    for preconditioner in ['id', 'med']:
+        expected, expected_ksd = thin(sample, gradient, 30, preconditioner=preconditioner, return_ksd=True)
+        idx, values = thin(sample, gradient, 30, preconditioner=preconditioner, return_ksd=True, deduplicate=True)
+        np.testing.assert_array_equal(idx, expected)
+        np.testing.assert_allclose(values, expected_ksd)
+    assert np.all(np.isin(idx, first))
+
+    idx = thin(sample, gradient, 10, deduplicate=True, prefilter='diagonal', n_candidates=100)
+    assert np.all(np.isin(idx, first))
+
+    integrand = _make_stein_integrand(sample, gradient)
+    np.testing.assert_allclose(
+        weighted_ksd(integrand.subset(first), counts, block_size=64),
+        ksd(integrand, len(rows), checkpoints=[len(rows) - 1])[0],
+    )
+
+
+def test_selection_weights(demo_smp, demo_scr):
+    idx = thin(demo_smp, demo_scr, 40)
+    weights, value = selection_weights(demo_smp, demo_scr, idx)
+    assert weights.shape == idx.shape
+    np.testing.assert_allclose(np.sum(weights), 1)
+    assert value < selection_ksd(demo_smp, demo_scr, idx)
+
+    # Points selected several times share the weight of their first occurrence
+    repeated = np.concatenate([idx, idx[:5]])
+    repeated_weights, repeated_value = selection_weights(demo_smp, demo_scr, repeated)
+    np.testing.assert_allclose(repeated_value, value, rtol=1e-5)
+    np.testing.assert_array_equal(repeated_weights[len(idx):], 0)